@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark processing of footnotes and cross references.
+
+Books are run through the line by line stages that come before
+c2o_noterefmarkers, then c2o_noterefmarkers is timed on its own over every
+line. By default a synthetic study bible is used, where most verses have
+long footnotes and cross references, along with the same bible without the
+study notes to show the cost for lines without notes.
+
+"""
+
+import sys
+from argparse import (
+    ArgumentDefaultsHelpFormatter,
+    ArgumentParser,
+    Namespace as argsNamespace,
+)
+from glob import glob
+from itertools import chain
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from synthetic import generatebible
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from u2o import (  # noqa: E402
+    NOTECHECKPATTERN,
+    c2o_bookstart,
+    c2o_identification,
+    c2o_noterefmarkers,
+    c2o_specialfeatures,
+    c2o_specialtext,
+    getre,
+    proc_bookencoding,
+    proc_readbook,
+)
+
+
+def notelines(fnames: list[str]) -> list[str]:
+    """Get the lines of each book as they are passed to c2o_noterefmarkers."""
+    lines: list[str] = []
+    for fname in fnames:
+        text = proc_readbook(fname, proc_bookencoding(fname, None))
+        lines.extend(
+            c2o_specialfeatures(c2o_specialtext(c2o_identification(_)))
+            for _ in c2o_bookstart(text)[2]
+        )
+    return lines
+
+
+def besttime(lines: list[str], runs: int) -> float:
+    """Return the best time out of several runs."""
+    best = float("inf")
+    for _ in range(runs):
+        start = perf_counter()
+        for line in lines:
+            c2o_noterefmarkers(line)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main(corpora: list[tuple[str, list[str]]], runs: int) -> None:
+    """Run the benchmark for each corpus and print the results."""
+    print(f"{'corpus':<16}{'lines':>9}{'notes':>9}{'time':>11}{'per line':>12}")
+    for name, fnames in corpora:
+        lines = notelines(fnames)
+        notes = sum(getre(NOTECHECKPATTERN).search(_) is not None for _ in lines)
+        secs = besttime(lines, runs)
+        print(
+            f"{name:<16}{len(lines):>9}{notes:>9}{secs:10.4f}s"
+            f"{secs / max(len(lines), 1) * 1e6:9.2f} us"
+        )
+
+
+if __name__ == "__main__":
+    PARSER = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description="""
+            benchmark processing of footnotes and cross references.
+        """,
+    )
+    PARSER.add_argument("-r", help="number of runs", type=int, default=5)
+    PARSER.add_argument(
+        "--scale",
+        help="scale for number of verses per chapter of synthetic bible",
+        type=float,
+        default=0.5,
+    )
+    PARSER.add_argument(
+        "--notes",
+        help="chance of a study bible note in a verse of synthetic bible",
+        type=float,
+        default=0.9,
+    )
+    PARSER.add_argument(
+        "file",
+        help="use these files instead of a synthetic bible (wildcards allowed)",
+        nargs="*",
+        metavar="filename",
+    )
+    ARGS: argsNamespace = PARSER.parse_args()
+
+    if ARGS.file:
+        main(
+            [
+                (
+                    "files",
+                    [_ for __ in ARGS.file for _ in chain(glob(__)) if path.isfile(_)],
+                )
+            ],
+            ARGS.r,
+        )
+    else:
+        with TemporaryDirectory() as tmpdir:
+            main(
+                [
+                    (
+                        "study bible",
+                        generatebible(
+                            path.join(tmpdir, "study"),
+                            ARGS.scale,
+                            notes=ARGS.notes,
+                        ),
+                    ),
+                    (
+                        "plain bible",
+                        generatebible(path.join(tmpdir, "plain"), ARGS.scale),
+                    ),
+                ],
+                ARGS.r,
+            )
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Time each stage of converting USFM to OSIS.
+
+Every stage of doconvert is timed separately over all books, along with
+reading the files, assembling the OSIS document, validation and writing
+the output. The bundled corpus in the corpus directory is used unless
+files are given or a synthetic bible is requested. A synthetic bible
+without paragraph markup can be used to benchmark unmarked text.
+
+Results are written as JSON so runs can be compared between versions
+using the --compare option. The time per line of each stage is also shown,
+using the number of lines that are processed line by line.
+
+"""
+
+import json
+import logging
+import sys
+from argparse import (
+    ArgumentDefaultsHelpFormatter,
+    ArgumentParser,
+    Namespace as argsNamespace,
+)
+from codecs import encode
+from datetime import datetime
+from glob import glob
+from itertools import chain
+from os import path
+from platform import python_version
+from tempfile import TemporaryDirectory, TemporaryFile
+from time import perf_counter
+from typing import Any, Callable
+from unicodedata import normalize
+
+from synthetic import generatebible
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import u2o  # noqa: E402
+
+CORPUS = path.join(path.dirname(path.abspath(__file__)), "corpus")
+
+
+def readbooks(fnames: list[str]) -> list[str]:
+    """Read the text of each file."""
+    return [u2o.proc_readbook(_, u2o.proc_bookencoding(_, None)) for _ in fnames]
+
+
+def payload(func: Callable[[Any], Any]) -> Callable[[tuple[str, Any], str], Any]:
+    """Apply func to the text being converted, keeping the description."""
+    return lambda state, bookid: (state[0], func(state[1]))
+
+
+def eachline(func: Callable[[str], str]) -> Callable[[tuple[str, Any], str], Any]:
+    """Apply func to each line of the text being converted."""
+    return payload(lambda lines: [func(_) for _ in lines])
+
+
+def bookstages() -> list[tuple[str, Callable[[tuple[str, Any], str], Any]]]:
+    """Get the stages of doconvert in the order they are run."""
+    return [
+        (
+            "convertcl",
+            payload(lambda x: u2o.convertcl(x) if r"\cl " in x else x),
+        ),
+        ("c2o_getdescription", lambda state, bookid: u2o.c2o_getdescription(state[1])),
+        ("reflow", payload(u2o.reflow)),
+        ("c2o_preprocess", payload(u2o.c2o_preprocess)),
+        ("markintroend", payload(lambda x: u2o.markintroend(x.splitlines()))),
+        ("c2o_identification", eachline(u2o.c2o_identification)),
+        ("c2o_specialtext", eachline(u2o.c2o_specialtext)),
+        ("c2o_specialfeatures", eachline(u2o.c2o_specialfeatures)),
+        ("c2o_noterefmarkers", eachline(u2o.c2o_noterefmarkers)),
+        ("c2o_ztags", eachline(u2o.c2o_ztags)),
+        ("c2o_titlepar", eachline(u2o.c2o_titlepar)),
+        ("c2o_processwj2", payload(u2o.c2o_processwj2)),
+        ("c2o_fixgroupings", payload(u2o.c2o_fixgroupings)),
+        (
+            "c2o_chapverse",
+            lambda state, bookid: (state[0], u2o.c2o_chapverse(state[1], bookid)),
+        ),
+        (
+            "post_prepare",
+            payload(
+                lambda lines: [
+                    _.strip()
+                    for _ in "\n".join(lines).splitlines()
+                    if _.strip() != "" and _.strip() != "<!-- b -->"
+                ]
+            ),
+        ),
+        ("post_sidebar", payload(u2o.post_sidebar)),
+        ("post_vp", payload(u2o.post_vp)),
+        ("post_tagadjust", payload(u2o.post_tagadjust)),
+        ("post_nodes", payload(u2o.post_nodes)),
+        ("post_swap_lblg", payload(u2o.post_swap_lblg)),
+        ("post_verseend", payload(u2o.post_verseend)),
+        ("post_versestart", payload(u2o.post_versestart)),
+        ("post_selahlgl", payload(u2o.post_selahlgl)),
+        ("post_lgl", payload(u2o.post_lgl)),
+        ("post_dverse", payload(u2o.post_dverse)),
+        ("post_acrostic", payload(u2o.post_acrostic)),
+        (
+            "post_join",
+            payload(lambda nodes: "\n".join([_[1] for _ in nodes if _[1] != ""])),
+        ),
+    ]
+
+
+def timestage(times: dict[str, float], name: str, func: Callable[[], Any]) -> Any:
+    """Run func, keeping the best time for the stage."""
+    start = perf_counter()
+    result = func()
+    times[name] = min(times.get(name, float("inf")), perf_counter() - start)
+    return result
+
+
+def runstages(fnames: list[str], times: dict[str, float]) -> list[tuple[str, ...]]:
+    """Run every stage once, keeping the best time for each stage."""
+    texts = timestage(times, "proc_readbook", lambda: readbooks(fnames))
+    bookids = [u2o.c2o_bookstart(_)[0] for _ in texts]
+
+    # convert books one stage at a time.
+    states: list[Any] = [("", _) for _ in texts]
+    for name, func in bookstages():
+        states = timestage(
+            times,
+            name,
+            lambda func=func, states=states: [func(*_) for _ in zip(states, bookids)],
+        )
+    results = [(_[1], _[0][0], _[0][1]) for _ in zip(states, bookids)]
+
+    # assemble, validate and write the osis document the same way processtexts does.
+    def assemble() -> str:
+        books, descriptions, booklist = u2o.proc_storeresults(results)
+        bookorder = u2o.proc_bookorder("canonical", booklist, books)
+        tmp = "\n".join([books[_] for _ in bookorder])
+        header = u2o.proc_osisheader(
+            "BENCH", "und", [descriptions[_] for _ in bookorder], "<w " in tmp
+        )
+        return f"{header}{tmp}{u2o.OSISFOOTER}\n"
+
+    osisdoc = timestage(times, "assembly", assemble)
+    osisdoc2 = timestage(
+        times, "normalize", lambda: encode(normalize("NFC", osisdoc), "utf_8")
+    )
+    if u2o.HAVELXML:
+        osisdoc2 = timestage(
+            times, "proc_xmlvalidate", lambda: u2o.proc_xmlvalidate(osisdoc2)
+        )
+    osisdoc2 = timestage(
+        times,
+        "proc_cleanup",
+        lambda: u2o.proc_cleanup(osisdoc2.decode("utf_8")).encode("utf_8"),
+    )
+    with TemporaryFile() as ofile:
+        timestage(times, "write", lambda: ofile.write(osisdoc2))
+    return results
+
+
+def benchmark(fnames: list[str], runs: int) -> dict[str, Any]:
+    """Run the benchmark and return the results."""
+    times: dict[str, float] = {}
+    results: list[tuple[str, ...]] = []
+    for _ in range(runs):
+        results = runstages(fnames, times)
+
+    # time doconvert as a whole, and make sure the stages gave the same results.
+    texts = readbooks(fnames)
+    best = float("inf")
+    converted: list[tuple[str, ...]] = []
+    for _ in range(runs):
+        start = perf_counter()
+        converted = [u2o.doconvert(_) for _ in texts]
+        best = min(best, perf_counter() - start)
+
+    return {
+        "version": u2o.META["VERSION"],
+        "python": python_version(),
+        "lxml": u2o.HAVELXML,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "runs": runs,
+        "files": len(fnames),
+        "characters": sum(len(_) for _ in texts),
+        "lines": sum(len(u2o.c2o_bookstart(_)[2]) for _ in texts),
+        "stages": times,
+        "totals": {"stages": sum(times.values()), "doconvert": best},
+        "matches": converted == results,
+    }
+
+
+def report(data: dict[str, Any], old: dict[str, Any] | None) -> None:
+    """Print a table of results to stderr, comparing with old results if given."""
+    rows = chain(
+        data["stages"].items(),
+        (("total: " + _[0], _[1]) for _ in data["totals"].items()),
+    )
+    lines = max(data["lines"], 1)
+    print(
+        f"{data['files']} files, {data['characters']} characters, {data['lines']} lines,"
+        f" best of {data['runs']} runs",
+        file=sys.stderr,
+    )
+    print(
+        f"{'stage':<24}{'time':>11}{'per line':>12}"
+        + (f"{'old time':>11}{'new/old':>9}" if old is not None else ""),
+        file=sys.stderr,
+    )
+    for name, secs in rows:
+        line = f"{name:<24}{secs:10.4f}s{secs / lines * 1e6:9.2f} us"
+        if old is not None:
+            oldsecs = (
+                old["totals"].get(name[7:])
+                if name.startswith("total: ")
+                else old["stages"].get(name)
+            )
+            if oldsecs:
+                line = f"{line}{oldsecs:10.4f}s{secs / oldsecs:8.2f}x"
+        print(line, file=sys.stderr)
+    if not data["matches"]:
+        print("WARNING: stage results differ from doconvert!", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    PARSER = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description="""
+            time each stage of converting USFM to OSIS.
+        """,
+    )
+    PARSER.add_argument("-r", help="number of runs", type=int, default=5)
+    PARSER.add_argument("-o", help="write JSON results to file", metavar="output_file")
+    PARSER.add_argument(
+        "--compare", help="compare with results from an earlier run", metavar="FILE"
+    )
+    PARSER.add_argument(
+        "--synthetic", help="benchmark a synthetic bible", action="store_true"
+    )
+    PARSER.add_argument(
+        "--scale",
+        help="scale for number of verses per chapter of synthetic bible",
+        type=float,
+        default=1.0,
+    )
+    PARSER.add_argument(
+        "--density",
+        help="chance of extra markup in a verse of synthetic bible",
+        type=float,
+        default=0.3,
+    )
+    PARSER.add_argument(
+        "--unmarked",
+        help="use synthetic bible without paragraph or other markup",
+        action="store_true",
+    )
+    PARSER.add_argument(
+        "file",
+        help="file or files to process (wildcards allowed)",
+        nargs="*",
+        metavar="filename",
+    )
+    ARGS: argsNamespace = PARSER.parse_args()
+    u2o.LOG.setLevel(logging.ERROR)
+
+    OLD = None
+    if ARGS.compare is not None:
+        with open(ARGS.compare, "r", encoding="utf-8") as cfile:
+            OLD = json.load(cfile)
+
+    with TemporaryDirectory() as tmpdir:
+        if ARGS.synthetic or ARGS.unmarked:
+            FILES = generatebible(
+                tmpdir, ARGS.scale, ARGS.density, unmarked=ARGS.unmarked
+            )
+            CORPUSNAME = (
+                f"synthetic unmarked scale={ARGS.scale}"
+                if ARGS.unmarked
+                else f"synthetic scale={ARGS.scale} density={ARGS.density}"
+            )
+        elif ARGS.file:
+            FILES = [_ for __ in ARGS.file for _ in chain(glob(__)) if path.isfile(_)]
+            CORPUSNAME = "files"
+        else:
+            FILES = sorted(glob(path.join(CORPUS, "*.usfm")))
+            CORPUSNAME = "bundled"
+        DATA = {"corpus": CORPUSNAME} | benchmark(FILES, ARGS.r)
+
+    report(DATA, OLD)
+    if ARGS.o is not None:
+        with open(ARGS.o, "w", encoding="utf-8") as jfile:
+            json.dump(DATA, jfile, indent=2)
+            jfile.write("\n")
+    else:
+        print(json.dumps(DATA, indent=2))
+    sys.exit(0 if DATA["matches"] else 1)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark how long u2o takes to start.
+
+The time taken to import u2o is measured with python -X importtime, along
+with the modules it imports that take the longest. The time for a cold
+start conversion of a one chapter book (Jude from the bundled corpus) is
+also measured, both running u2o.py as a script and with python -m u2o,
+which can use the cached bytecode of u2o. The time to start python itself
+is shown for comparison.
+
+Results are written as JSON so runs can be compared between versions
+using the --compare option.
+
+"""
+
+import json
+import subprocess  # nosec
+import sys
+from argparse import (
+    ArgumentDefaultsHelpFormatter,
+    ArgumentParser,
+    Namespace as argsNamespace,
+)
+from datetime import datetime
+from os import path
+from platform import python_version
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+BOOK = path.join(path.dirname(path.abspath(__file__)), "corpus", "65JUD.usfm")
+
+
+def importtimes(runs: int) -> tuple[float, float, list[tuple[str, float]]]:
+    """
+    Get the import time of u2o, its own time and the slowest modules it imports.
+
+    The run with the lowest import time is used. Times are in seconds.
+
+    """
+    best: tuple[float, float, list[tuple[str, float]]] = (float("inf"), 0.0, [])
+    for _ in range(runs):
+        result = subprocess.run(  # nosec
+            [sys.executable, "-X", "importtime", "-c", "import u2o"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        modules: list[tuple[str, float]] = []
+        total = own = 0.0
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line[12:]:
+                continue
+            selftime, cumulative, name = line[12:].split("|")
+            if not selftime.strip().isdigit():
+                continue
+            if name.strip() == "u2o":
+                total, own = int(cumulative) / 1e6, int(selftime) / 1e6
+            # modules imported directly by u2o are indented one level.
+            elif len(name) - len(name.lstrip()) == 3:
+                modules.append((name.strip(), int(cumulative) / 1e6))
+        if total < best[0]:
+            best = (total, own, sorted(modules, key=lambda x: -x[1]))
+    return best
+
+
+def besttime(command: list[str], runs: int, cwd: str) -> float:
+    """Return the best time out of several runs of a command."""
+    best = float("inf")
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run(command, cwd=cwd, capture_output=True, check=True)  # nosec
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def benchmark(runs: int) -> dict[str, Any]:
+    """Run the benchmark and return the results."""
+    # make sure the cached bytecode for u2o is up to date.
+    subprocess.run([sys.executable, "-c", "import u2o"], cwd=ROOT, check=True)  # nosec
+    total, own, modules = importtimes(runs)
+    with TemporaryDirectory() as tmpdir:
+        output = path.join(tmpdir, "JUD.osis")
+        times = {
+            "python": besttime([sys.executable, "-c", "pass"], runs, tmpdir),
+            "import u2o": total,
+            "u2o.py": besttime(
+                [sys.executable, path.join(ROOT, "u2o.py"), "-o", output, "JUD", BOOK],
+                runs,
+                tmpdir,
+            ),
+            "python -m u2o": besttime(
+                [sys.executable, "-m", "u2o", "-o", output, "JUD", BOOK], runs, ROOT
+            ),
+        }
+    return {
+        "python": python_version(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "runs": runs,
+        "times": times,
+        "u2o": own,
+        "modules": dict(modules),
+    }
+
+
+def report(data: dict[str, Any], old: dict[str, Any] | None, count: int) -> None:
+    """Print a table of results to stderr, comparing with old results if given."""
+    print(f"best of {data['runs']} runs", file=sys.stderr)
+    print(
+        f"{'':<30}{'time':>11}"
+        + (f"{'old time':>11}{'new/old':>9}" if old is not None else ""),
+        file=sys.stderr,
+    )
+    rows = list(data["times"].items())
+    rows.append(("  u2o module", data["u2o"]))
+    rows.extend((f"  {_[0]}", _[1]) for _ in list(data["modules"].items())[:count])
+    for name, secs in rows:
+        line = f"{name:<30}{secs * 1000:9.1f}ms"
+        if old is not None:
+            if name == "  u2o module":
+                oldsecs = old["u2o"]
+            elif name.startswith("  "):
+                oldsecs = old["modules"].get(name[2:])
+            else:
+                oldsecs = old["times"].get(name)
+            if oldsecs:
+                line = f"{line}{oldsecs * 1000:9.1f}ms{secs / oldsecs:8.2f}x"
+        print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    PARSER = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description="""
+            benchmark how long u2o takes to start.
+        """,
+    )
+    PARSER.add_argument("-r", help="number of runs", type=int, default=10)
+    PARSER.add_argument("-o", help="write JSON results to file", metavar="output_file")
+    PARSER.add_argument(
+        "--compare", help="compare with results from an earlier run", metavar="FILE"
+    )
+    PARSER.add_argument(
+        "--modules", help="number of imported modules to show", type=int, default=10
+    )
+    ARGS: argsNamespace = PARSER.parse_args()
+
+    OLD = None
+    if ARGS.compare is not None:
+        with open(ARGS.compare, "r", encoding="utf-8") as cfile:
+            OLD = json.load(cfile)
+
+    DATA = benchmark(ARGS.r)
+    report(DATA, OLD, ARGS.modules)
+    if ARGS.o is not None:
+        with open(ARGS.o, "w", encoding="utf-8") as jfile:
+            json.dump(DATA, jfile, indent=2)
+            jfile.write("\n")
+    else:
+        print(json.dumps(DATA, indent=2))
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic USFM bible for benchmarking.
+
+Books have the same number of chapters as a real bible. The number of
+verses in each chapter is scaled by the scale option, and the density
+option sets the chance of each verse having extra markup like footnotes,
+cross references, words of Jesus, strongs numbers, poetry, lists and
+tables. The notes option sets the chance of each verse also having the
+long footnotes and cross references of a study bible. The unmarked option
+generates books like those of legacy and draft translations, with only
+chapter and verse markers and verse text wrapped over several lines. The
+same seed always generates the same text.
+
+"""
+
+import random
+from argparse import (
+    ArgumentDefaultsHelpFormatter,
+    ArgumentParser,
+    Namespace as argsNamespace,
+)
+from os import makedirs, path
+
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-positional-arguments
+
+# usfm book id and number of chapters for each book
+BOOKS: tuple[tuple[str, int], ...] = (
+    ("GEN", 50),
+    ("EXO", 40),
+    ("LEV", 27),
+    ("NUM", 36),
+    ("DEU", 34),
+    ("JOS", 24),
+    ("JDG", 21),
+    ("RUT", 4),
+    ("1SA", 31),
+    ("2SA", 24),
+    ("1KI", 22),
+    ("2KI", 25),
+    ("1CH", 29),
+    ("2CH", 36),
+    ("EZR", 10),
+    ("NEH", 13),
+    ("EST", 10),
+    ("JOB", 42),
+    ("PSA", 150),
+    ("PRO", 31),
+    ("ECC", 12),
+    ("SNG", 8),
+    ("ISA", 66),
+    ("JER", 52),
+    ("LAM", 5),
+    ("EZK", 48),
+    ("DAN", 12),
+    ("HOS", 14),
+    ("JOL", 3),
+    ("AMO", 9),
+    ("OBA", 1),
+    ("JON", 4),
+    ("MIC", 7),
+    ("NAM", 3),
+    ("HAB", 3),
+    ("ZEP", 3),
+    ("HAG", 2),
+    ("ZEC", 14),
+    ("MAL", 4),
+    ("MAT", 28),
+    ("MRK", 16),
+    ("LUK", 24),
+    ("JHN", 21),
+    ("ACT", 28),
+    ("ROM", 16),
+    ("1CO", 16),
+    ("2CO", 13),
+    ("GAL", 6),
+    ("EPH", 6),
+    ("PHP", 4),
+    ("COL", 4),
+    ("1TH", 5),
+    ("2TH", 3),
+    ("1TI", 6),
+    ("2TI", 4),
+    ("TIT", 3),
+    ("PHM", 1),
+    ("HEB", 13),
+    ("JAS", 5),
+    ("1PE", 5),
+    ("2PE", 3),
+    ("1JN", 5),
+    ("2JN", 1),
+    ("3JN", 1),
+    ("JUD", 1),
+    ("REV", 22),
+)
+
+WORDS: tuple[str, ...] = tuple("""
+    and the of that in he unto said lord his him they them shall for was
+    be is with not all which people land day god house son king came
+    hath thou thy before earth out upon children against israel man hand
+    up also words heaven spirit light water good go went made great
+    """.split())
+
+
+def words(rng: random.Random, count: int) -> str:
+    """Return some random words."""
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def studynote(rng: random.Random, chap: int, vnum: int) -> str:
+    """Generate a study bible footnote and cross reference for a verse."""
+    parts = [f"\\f + \\fr {chap}:{vnum} \\fk {words(rng, 2)}: \\ft {words(rng, 12)}"]
+    for _ in range(rng.randint(0, 3)):
+        parts.append(f"\\fq {words(rng, 3)}\\fq* \\ft {words(rng, 10)}")
+    if rng.random() < 0.3:
+        parts.append(f"\\fqa {words(rng, 2)}\\fqa*")
+    if rng.random() < 0.3:
+        parts.append(f"\\fp {words(rng, 15)}")
+    parts.append(f"\\f*\\x - \\xo {chap}:{vnum} \\xt Gen 1:{vnum}; Exod 2:3\\x*")
+    return " ".join(parts)
+
+
+def verse(
+    rng: random.Random, chap: int, vnum: int, density: float, notes: float = 0.0
+) -> list[str]:
+    """Generate a verse and any paragraph markup that goes with it."""
+    lines: list[str] = []
+    text = words(rng, rng.randint(8, 20))
+    note = studynote(rng, chap, vnum) if notes and rng.random() < notes else ""
+    if rng.random() >= density:
+        return [f"\\v {vnum} {text}{note}"]
+
+    kind = rng.randrange(10)
+    if kind == 0:
+        text = f"{text}\\f + \\fr {chap}:{vnum} \\ft {words(rng, 6)} \\fq {words(rng, 2)}\\fq*\\f*"
+    elif kind == 1:
+        text = f"{text}\\x - \\xo {chap}:{vnum} \\xt Gen 1:1; Exod 2:3\\x*"
+    elif kind == 2:
+        text = f"\\wj {text} \\add {words(rng, 2)}\\add*\\wj*"
+    elif kind == 3:
+        text = f'\\w {rng.choice(WORDS)}|strong="H{rng.randint(1, 8674)}"\\w* {text}'
+    elif kind == 4:
+        text = f"{text} \\nd Lord\\nd* {words(rng, 3)}"
+    elif kind == 5:
+        lines.append("\\q1")
+        text = f"{text}\n\\q2 {words(rng, 6)}"
+        if rng.random() < 0.3:
+            text = f"{text}\n\\qs Selah\\qs*"
+    elif kind == 6:
+        text = f"{text}\n\\li1 {words(rng, 5)}\n\\li2 {words(rng, 5)}"
+    elif kind == 7:
+        text = f"{text}\n\\tr \\th1 {words(rng, 1)} \\th2 {words(rng, 1)}"
+        text = f"{text}\n\\tr \\tc1 {words(rng, 2)} \\tc2 {words(rng, 2)}"
+    elif kind == 8:
+        qid = f"q{chap}.{vnum}"
+        text = f'{text} \\qt-s |id="{qid}" who="Paul"\\* {words(rng, 4)} \\qt-e |id="{qid}"\\*'
+    else:
+        text = f"\\em {words(rng, 2)}\\em* {text} ~ {words(rng, 2)} // {words(rng, 2)}"
+    lines.append(f"\\v {vnum} {text}{note}")
+    return lines
+
+
+def unmarkedverse(rng: random.Random, vnum: int) -> list[str]:
+    """Generate a verse without paragraph or other markup."""
+    lines = [words(rng, rng.randint(4, 8)) for _ in range(rng.randint(1, 4))]
+    return [f"\\v {vnum} {lines[0]}", *lines[1:]]
+
+
+def generatebook(
+    bookid: str,
+    chapters: int,
+    verses: int,
+    density: float,
+    rng: random.Random,
+    notes: float = 0.0,
+    unmarked: bool = False,
+) -> str:
+    """Generate the text for a book."""
+    if unmarked:
+        lines = [
+            f"\\id {bookid} Synthetic benchmark text",
+            "\\ide UTF-8",
+            f"\\h {bookid}",
+            f"\\toc1 The Book of {bookid}",
+            f"\\toc2 {bookid}",
+        ]
+        for chap in range(1, chapters + 1):
+            lines.append(f"\\c {chap}")
+            for vnum in range(1, verses + 1):
+                lines.extend(unmarkedverse(rng, vnum))
+        return "\n".join(lines) + "\n"
+
+    lines = [
+        f"\\id {bookid} Synthetic benchmark text",
+        "\\ide UTF-8",
+        f"\\h {bookid}",
+        f"\\toc1 The Book of {bookid}",
+        f"\\toc2 {bookid}",
+        f"\\mt1 The Book of {bookid}",
+        "\\is1 Introduction",
+        f"\\ip {words(rng, 30)}",
+        "\\ie",
+    ]
+    for chap in range(1, chapters + 1):
+        lines.extend([f"\\c {chap}", f"\\s1 {words(rng, 4)}", "\\p"])
+        for vnum in range(1, verses + 1):
+            # start new paragraphs now and then, and always after lists and tables
+            lastline = lines[-1].rpartition("\n")[2]
+            if (vnum > 1 and rng.random() < 0.15) or lastline[:3] in {"\\li", "\\tr"}:
+                lines.append("\\p")
+            lines.extend(verse(rng, chap, vnum, density, notes))
+    return "\n".join(lines) + "\n"
+
+
+def generatebible(
+    outdir: str,
+    scale: float = 1.0,
+    density: float = 0.3,
+    seed: int = 1,
+    books: list[str] | None = None,
+    notes: float = 0.0,
+    unmarked: bool = False,
+) -> list[str]:
+    """Write a synthetic bible to outdir and return the list of files."""
+    rng = random.Random(seed)
+    makedirs(outdir, exist_ok=True)
+    verses = max(1, round(26 * scale))
+    fnames = []
+    for num, (bookid, chapters) in enumerate(BOOKS, 1):
+        if books is not None and bookid not in books:
+            continue
+        fname = path.join(outdir, f"{num:02d}{bookid}.usfm")
+        with open(fname, "w", encoding="utf-8") as ofile:
+            ofile.write(
+                generatebook(bookid, chapters, verses, density, rng, notes, unmarked)
+            )
+        fnames.append(fname)
+    return fnames
+
+
+if __name__ == "__main__":
+    PARSER = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description="""
+            generate a synthetic USFM bible for benchmarking.
+        """,
+    )
+    PARSER.add_argument(
+        "--scale",
+        help="scale for number of verses per chapter",
+        type=float,
+        default=1.0,
+    )
+    PARSER.add_argument(
+        "--density", help="chance of extra markup in a verse", type=float, default=0.3
+    )
+    PARSER.add_argument(
+        "--notes",
+        help="chance of a study bible note in a verse",
+        type=float,
+        default=0.0,
+    )
+    PARSER.add_argument(
+        "--unmarked",
+        help="generate text without paragraph or other markup",
+        action="store_true",
+    )
+    PARSER.add_argument("--seed", help="random seed", type=int, default=1)
+    PARSER.add_argument(
+        "--books", help="only generate these books (usfm book ids)", nargs="+"
+    )
+    PARSER.add_argument("outdir", help="directory to write usfm files to")
+    ARGS: argsNamespace = PARSER.parse_args()
+    for _ in generatebible(
+        ARGS.outdir,
+        ARGS.scale,
+        ARGS.density,
+        ARGS.seed,
+        ARGS.books,
+        ARGS.notes,
+        ARGS.unmarked,
+    ):
+        print(_)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Batch converter for u2o.
+
+Converts many works in one run using a single process pool. The books of
+all works are converted together, largest books first, so the pool stays
+busy until the very end of the batch. Each work is assembled, validated
+and written by the pool as soon as its last book has been converted. A
+work that can't be converted is reported, and the rest of the batch is
+converted anyway.
+
+Works are listed in a manifest, which is either a JSON file holding a list
+of objects, or a CSV file with a header row. Fields (only workid and files
+are required):
+    workid       - work id to use for OSIS file
+    files        - files to process (wildcards allowed). A list of patterns
+                   may be given in JSON manifests.
+    output       - output file (default: workid.osis)
+    langcode     - language code (default: und)
+    sortorder    - sort order (default: canonical)
+    encoding     - encoding to use for USFM files
+    nonormalize  - disable unicode NFC normalization
+
+"""
+
+import csv
+import json
+import logging
+from argparse import (
+    ArgumentDefaultsHelpFormatter,
+    ArgumentParser,
+    Namespace as argsNamespace,
+)
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from glob import glob
+from itertools import chain
+from os import path
+from sys import exit as sysexit
+from typing import Any
+from u2o import (
+    proc_bookconvert,
+    proc_bookencoding,
+    proc_bookorders,
+    proc_executor,
+    proc_normalizebook,
+    proc_poolargs,
+    proc_startup,
+    proc_storeresults,
+    proc_submitchunks,
+    proc_workercount,
+    proc_writeosis,
+    LOG,
+    META,
+    HAVELXML,
+)
+
+# values that turn on nonormalize in CSV manifests
+TRUEVALUES = frozenset(("1", "true", "yes", "y"))
+
+# pylint: disable=broad-exception-caught
+# pylint: disable=too-many-locals
+
+
+def readmanifest(fname: str) -> list[dict[str, Any]]:
+    """Read the list of works from a JSON or CSV manifest."""
+    with open(fname, "r", encoding="utf_8_sig", newline="") as mfile:
+        if fname.lower().endswith(".json"):
+            works = json.load(mfile)
+        else:
+            works = [
+                {k: v for k, v in _.items() if k is not None and v not in {None, ""}}
+                for _ in csv.DictReader(mfile)
+            ]
+            for work in works:
+                if "nonormalize" in work:
+                    work["nonormalize"] = work["nonormalize"].lower() in TRUEVALUES
+    if not isinstance(works, list) or not all(isinstance(_, dict) for _ in works):
+        raise ValueError("manifest must be a list of works")
+    return works
+
+
+def preparework(work: dict[str, Any]) -> dict[str, Any]:
+    """Check the fields of a work, and find its books and their encodings."""
+    if not isinstance(work.get("workid"), str) or not work.get("files"):
+        raise ValueError("workid and files are required")
+    sortorder = work.get("sortorder", "canonical")
+    if sortorder not in proc_bookorders():
+        raise ValueError(f"unknown sort order: {sortorder}")
+    patterns = [work["files"]] if isinstance(work["files"], str) else work["files"]
+    fnames = [_ for __ in patterns for _ in chain(glob(__)) if path.isfile(_)]
+    if not fnames:
+        raise ValueError("no input files found")
+    return {
+        "workid": work["workid"],
+        "output": work.get("output") or f"{work['workid']}.osis",
+        "langcode": work.get("langcode", "und"),
+        "sortorder": sortorder,
+        "nonormalize": bool(work.get("nonormalize", False)),
+        "books": [(_, proc_bookencoding(_, work.get("encoding"))) for _ in fnames],
+    }
+
+
+def prepareworks(works: list[dict[str, Any]]) -> tuple[list[dict[str, Any]], int]:
+    """Prepare all works, returning those that are ready and the number that failed."""
+    prepared: list[dict[str, Any]] = []
+    failed = 0
+    for num, work in enumerate(works, 1):
+        try:
+            prepared.append(preparework(work))
+        except (OSError, ValueError, SystemExit) as err:
+            failed += 1
+            LOG.error(
+                "*** work %s: %s ***",
+                num,
+                str(err) if str(err) not in {"", "None"} else "processing aborted",
+            )
+    return prepared, failed
+
+
+def finishwork(
+    work: dict[str, Any], results: list[tuple[str, ...]], validatebooks: bool
+) -> None:
+    """
+    Assemble, validate and write the osis for a work.
+
+    This is run by the pool, so books are validated by the worker that
+    writes the work.
+
+    """
+    books, descriptions, booklist = proc_storeresults(results)
+    proc_writeosis(
+        books,
+        descriptions,
+        booklist,
+        work["sortorder"],
+        work["langcode"],
+        work["nonormalize"],
+        work["workid"],
+        work["output"],
+        validatebooks=validatebooks,
+    )
+
+
+def runbatch(
+    works: list[dict[str, Any]],
+    executor: Executor,
+    workers: int,
+    validatebooks: bool = False,
+    chunksize: int | None = None,
+) -> int:
+    """
+    Convert all works, returning the number of works that failed.
+
+    Books are submitted largest first, so a large book isn't left running
+    alone at the end, and only a couple per worker at a time, so finished
+    works are written promptly.
+
+    """
+    failed = 0
+    tasks = deque(
+        sorted(
+            (
+                (path.getsize(book[0]), num, idx)
+                for num, work in enumerate(works)
+                for idx, book in enumerate(work["books"])
+            ),
+            reverse=True,
+        )
+    )
+    maxpending = 2 * workers
+    # futures of books have the index of the book, and futures that write
+    # works have an index of -1.
+    futures: dict[Future, tuple[int, int]] = {}
+    results: list[list[Any] | None] = [[None] * len(_["books"]) for _ in works]
+    remaining = [len(_["books"]) for _ in works]
+    pending = 0
+
+    while tasks or futures:
+        while tasks and pending < maxpending:
+            size, num, idx = tasks.popleft()
+            if results[num] is None:
+                continue
+            book = works[num]["books"][idx]
+            finish = None if works[num]["nonormalize"] else proc_normalizebook
+            future = (
+                proc_submitchunks(executor, book, chunksize, None, finish)
+                if chunksize is not None and size > chunksize
+                else executor.submit(proc_bookconvert, book, False, None, finish)
+            )
+            futures[future] = (num, idx)
+            pending += 1
+
+        for future in wait(futures, return_when=FIRST_COMPLETED)[0]:
+            num, idx = futures.pop(future)
+            try:
+                if idx < 0:
+                    future.result()
+                    continue
+                pending -= 1
+                workresults = results[num]
+                if workresults is None:
+                    continue
+                workresults[idx] = future.result()[0]
+                remaining[num] -= 1
+                if remaining[num] == 0:
+                    results[num] = None
+                    LOG.info("Writing %s...", works[num]["output"])
+                    futures[
+                        executor.submit(
+                            finishwork, works[num], workresults, validatebooks
+                        )
+                    ] = (num, -1)
+            except (Exception, SystemExit) as err:
+                # skip the rest of a work once one of its books fails.
+                results[num] = None
+                failed += 1
+                LOG.error(
+                    "%s: %s",
+                    works[num]["workid"],
+                    str(err) if str(err) not in {"", "None"} else "processing aborted",
+                )
+    return failed
+
+
+# ---------------------------------------------------------------------------#
+
+
+if __name__ == "__main__":
+    PARSER = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description="""
+            convert many USFM bibles to OSIS, as listed in a manifest.
+        """,
+        epilog=f"""
+            * Version: {META['VERSION']} * {META['DATE']} * This script is public domain. *
+        """,
+    )
+    PARSER.add_argument("-v", help="verbose output", action="store_true")
+    PARSER.add_argument(
+        "--validate-books",
+        help="validate books separately (output is not reformatted)",
+        action="store_true",
+    )
+    proc_poolargs(PARSER, serial=False, profile=False)
+    PARSER.add_argument("manifest", help="JSON or CSV manifest of works to convert")
+    ARGS: argsNamespace = PARSER.parse_args()
+    proc_startup()
+
+    if not HAVELXML:
+        LOG.warning("Note:  lxml is not installed. Skipping OSIS validation.")
+
+    if ARGS.v:
+        LOG.setLevel(logging.INFO)
+
+    if ARGS.workers is not None and ARGS.workers < 1:
+        LOG.error("*** number of workers must be at least 1. ***")
+        sysexit(1)
+
+    try:
+        MANIFEST = readmanifest(ARGS.manifest)
+    except (OSError, ValueError) as err:
+        LOG.error("*** %s: %s ***", ARGS.manifest, err)
+        sysexit(1)
+    WORKS, FAILED = prepareworks(MANIFEST)
+    WORKERS = ARGS.workers if ARGS.workers is not None else proc_workercount()
+    with proc_executor(WORKERS, ARGS.start_method) as EXECUTOR:
+        BATCHFAILED = runbatch(
+            WORKS, EXECUTOR, WORKERS, ARGS.validate_books, ARGS.chunk_size
+        )
+    sysexit(1 if FAILED or BATCHFAILED else 0)
@@ -3,15 +3,83 @@
 import logging
 from sys import exit as sysexit
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser, Namespace as argsNamespace
-from tempfile import TemporaryDirectory
-from pathlib import Path
+from codecs import lookup
+from collections.abc import Iterator
 from os import path
-from u2o import processfiles, LOG, META, BOOKORDERS, HAVELXML
+from u2o import processtexts, proc_bookorders, proc_startup, LOG, META, HAVELXML, proc_poolargs
 
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-locals
 # pylint: disable=too-many-positional-arguments
 
+def booknames(fname: str, encoding: str) -> list[str]:
+    """Get the name of each book in a concatenated usfm file, in order."""
+    names: list[str] = []
+    with open(fname, "r", encoding=encoding) as ifile:
+        for line in (_ for __ in ifile for _ in __.splitlines()):
+            if line.startswith(r"\id ") and line[4:7] != (names[-1] if names else ""):
+                names.append(line[4:7])
+    return names
+
+
+def readbooks(fname: str, encoding: str, start: int = 0) -> Iterator[tuple[str, str]]:
+    """
+    Read a concatenated usfm file, yielding the name and text of each book.
+
+    Books are numbered from 0 in the order they are in the file, and books
+    before book number start are skipped.
+
+    """
+    book: list[str] = []
+    bname = ""
+    num = -1
+    with open(fname, "r", encoding=encoding) as ifile:
+        for line in (_ for __ in ifile for _ in __.splitlines()):
+            # a new book starts at each \id line, except when it repeats the
+            # book name of the \id line before it.
+            if line.startswith(r"\id ") and line[4:7] != bname:
+                if book:
+                    yield bname, "\n".join(book).strip()
+                book, bname, num = [], line[4:7], num + 1
+            if num >= start:
+                book.append(line)
+    if book:
+        yield bname, "\n".join(book).strip()
+
+
+def splitbooks(fname: str, fencoding: str | None) -> Iterator[str]:
+    """
+    Read a concatenated usfm file, yielding the text of each book.
+
+    When a book is in the file more than once, the text of its last copy is
+    used in the place of its first copy.
+
+    """
+    try:
+        encoding = lookup(fencoding).name if fencoding is not None else "utf_8_sig"
+    except LookupError:
+        LOG.error("ERROR: Unknown encoding... aborting conversion.")
+        sysexit()
+    # use utf_8_sig in place of utf_8 to skip any Byte Order Mark.
+    if encoding in {"utf-8", "utf_8"}:
+        encoding = "utf_8_sig"
+
+    names = booknames(fname, encoding)
+    firstcopy = {_[1]: _[0] for _ in reversed(list(enumerate(names)))}
+    lastcopy = {_[1]: _[0] for _ in enumerate(names)}
+    for bname in sorted(_ for _ in firstcopy if firstcopy[_] != lastcopy[_]):
+        LOG.warning("Note:  %s is in %s more than once. Using last copy.", bname, fname)
+
+    for num, (bname, text) in enumerate(readbooks(fname, encoding)):
+        if firstcopy[bname] != num:
+            continue
+        if lastcopy[bname] != num:
+            _, text = next(
+                readbooks(fname, encoding, lastcopy[bname]), (bname, text)
+            )
+        yield text
+
+
 def processfiles2(
     fname: str,
     fencoding: str,
@@ -21,58 +89,32 @@ def processfiles2(
     nonormalize: bool,
     workid: str,
     outputfile: str,
+    chunksize: int | None = None,
+    profile: str | None = None,
+    profileformat: str = "table",
+    workers: int | None = None,
+    startmethod: str | None = None,
+    serial: bool = False,
 ) -> None:
     """Unsplit a single concatenated usfm file for processing."""
 
-    # read file
-    LOG.info("Reading filename and splitting into separate files... ")
-    with open(fname, "rb") as ifile:
-        text = ifile.read()
-        textlines = text.decode("utf-8-sig").strip().splitlines()
-
-        # get index of locations for \id tags
-        idx = [textlines.index(_) for _ in textlines if _.startswith(r"\id ")]
-
-        # remove duplicate book names
-        i = len(idx) - 1
-        while i > 0:
-            if textlines[idx[i]][4:7] == textlines[idx[i - 1]][4:7]:
-                del idx[i]
-            i -= 1
-
-        # split into individual books
-        books = {}
-        i = 0
-        while i < len(idx):
-            bname = textlines[idx[i]][4:7]
-            start = idx[i]
-            try:
-                end = idx[i + 1]
-            except IndexError:
-                end = len(textlines)
-            books[bname] = "\n".join(textlines[start:end])
-            i += 1
-
-        # create temporary files and process
-        with TemporaryDirectory() as tmpdir:
-            filenames = []
-            pth = Path(tmpdir)
-            for j in books.items():
-                ipth = pth / j[0]
-                with open(ipth, "w+", encoding="utf-8") as outfile:
-                    outfile.write(j[1])
-                    filenames.append(str(ipth))
-
-            processfiles(
-                filenames,
-                fencoding,
-                dodebug,
-                sortorder,
-                langcode,
-                nonormalize,
-                workid,
-                outputfile,
-            )
+    # read file one book at a time and send books on for processing.
+    LOG.info("Reading file and splitting into separate books... ")
+    processtexts(
+        splitbooks(fname, fencoding),
+        dodebug,
+        sortorder,
+        langcode,
+        nonormalize,
+        workid,
+        outputfile,
+        chunksize=chunksize,
+        profile=profile,
+        profileformat=profileformat,
+        workers=workers,
+        startmethod=startmethod,
+        serial=serial,
+    )
 
 
 # ---------------------------------------------------------------------------#
@@ -101,7 +143,7 @@ if __name__ == "__main__":
         "-l", help="specify langauge code", metavar="LANG", default="und"
     )
     PARSER.add_argument(
-        "-s", help="sort order", choices=BOOKORDERS, default="canonical"
+        "-s", help="sort order", choices=proc_bookorders(), default="canonical"
     )
     PARSER.add_argument("-v", help="verbose output", action="store_true")
     PARSER.add_argument(
@@ -112,12 +154,14 @@ if __name__ == "__main__":
     PARSER.add_argument(
         "-n", help="disable unicode NFC normalization", action="store_true"
     )
+    proc_poolargs(PARSER)
     PARSER.add_argument(
         "file",
         help="file to process",
         metavar="filename",
     )
     ARGS: argsNamespace = PARSER.parse_args()
+    proc_startup()
 
     # make sure we skip OSIS validation if we don't have lxml
     if not ARGS.x and not HAVELXML:
@@ -128,6 +172,10 @@ if __name__ == "__main__":
         LOG.error("*** input file not present or not a normal file. ***")
         sysexit()
 
+    if ARGS.workers is not None and ARGS.workers < 1:
+        LOG.error("*** number of workers must be at least 1. ***")
+        sysexit()
+
     if ARGS.v:
         LOG.setLevel(logging.INFO)
     if ARGS.d:
@@ -141,4 +189,10 @@ if __name__ == "__main__":
         ARGS.n,
         ARGS.workid,
         ARGS.o,
+        chunksize=ARGS.chunk_size,
+        profile=ARGS.profile_output if ARGS.profile else None,
+        profileformat=ARGS.profile_format,
+        workers=ARGS.workers,
+        startmethod=ARGS.start_method,
+        serial=ARGS.serial,
     )
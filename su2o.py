@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Conversion server for u2o.
+
+Reads conversion jobs from stdin, one JSON object per line, and writes one
+JSON object per line to stdout for each finished job. A single process pool
+is kept running between jobs so each job only pays for the conversion.
+
+Job fields (only workid and files are required):
+    id           - returned unchanged in the response
+    workid       - work id to use for OSIS file
+    files        - list of files to process (wildcards allowed)
+    output       - output file. If omitted, the OSIS is returned in the
+                   "osis" field of the response instead.
+    encoding     - encoding to use for USFM files
+    langcode     - language code (default: und)
+    sortorder    - sort order (default: canonical)
+    nonormalize  - disable unicode NFC normalization
+    stream       - stream books to output as they are converted
+    validatebooks - validate books separately
+    cache        - directory used to cache converted books between runs
+
+Response fields:
+    id       - id from job
+    status   - "ok" or "error"
+    output   - output file, when one was given
+    osis     - OSIS document, when no output file was given
+    log      - warnings and errors logged while processing the job
+
+"""
+import json
+import logging
+import sys
+from argparse import (
+    ArgumentDefaultsHelpFormatter,
+    ArgumentParser,
+    Namespace as argsNamespace,
+)
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout, suppress
+from glob import glob
+from itertools import chain
+from logging.handlers import QueueListener
+from multiprocessing import get_context
+from os import path, remove
+from tempfile import NamedTemporaryFile
+from typing import Any
+from u2o import (
+    processfiles,
+    proc_bookorders,
+    proc_executor,
+    proc_poolargs,
+    proc_startup,
+    LOG,
+    META,
+    HAVELXML,
+)
+
+
+class ListHandler(logging.Handler):
+    """Logging handler that keeps messages for the current job."""
+
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.messages: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+def processjob(
+    job: dict[str, Any],
+    executor: Executor,
+    logqueue: Any = None,
+    chunksize: int | None = None,
+) -> dict[str, Any]:
+    """
+    Run a single conversion job and return the response.
+
+    logqueue is the queue the workers of executor put their log records on.
+    The records are logged here while the job runs, so they are included in
+    the response.
+
+    """
+    response: dict[str, Any] = {"id": job.get("id"), "status": "ok"}
+    handler = ListHandler()
+    LOG.addHandler(handler)
+    # LOG is used as the handler so records from the workers are treated
+    # like records logged in this process.
+    listener = QueueListener(logqueue, LOG) if logqueue is not None else None
+    if listener is not None:
+        listener.start()
+    outputfile = job.get("output")
+    tmpfile = None
+    try:
+        if not isinstance(job.get("workid"), str) or not job.get("files"):
+            raise ValueError("workid and files are required")
+        sortorder = job.get("sortorder", "canonical")
+        if sortorder not in proc_bookorders():
+            raise ValueError(f"unknown sort order: {sortorder}")
+        fnames = [_ for __ in job["files"] for _ in chain(glob(__)) if path.isfile(_)]
+        if not fnames:
+            raise ValueError("no input files found")
+        if outputfile is None:
+            with NamedTemporaryFile(suffix=".osis", delete=False) as ofile:
+                tmpfile = ofile.name
+            outputfile = tmpfile
+        # keep anything printed during processing out of the response stream.
+        with redirect_stdout(sys.stderr):
+            processfiles(
+                fnames,
+                job.get("encoding"),
+                False,
+                sortorder,
+                job.get("langcode", "und"),
+                bool(job.get("nonormalize", False)),
+                job["workid"],
+                outputfile,
+                stream=bool(job.get("stream", False)),
+                cachedir=job.get("cache"),
+                validatebooks=bool(job.get("validatebooks", False)),
+                executor=executor,
+                chunksize=chunksize,
+            )
+        if tmpfile is not None:
+            with open(tmpfile, "rb") as ifile:
+                response["osis"] = ifile.read().decode("utf_8")
+        else:
+            response["output"] = outputfile
+    except BrokenProcessPool:
+        # the pool can't be used any more, so it's left to serve to replace it.
+        raise
+    except (Exception, SystemExit) as err:  # pylint: disable=broad-exception-caught
+        response["status"] = "error"
+        handler.messages.append(
+            str(err) if str(err) not in {"", "None"} else "processing aborted"
+        )
+    finally:
+        # stopping the listener handles the records that are still queued.
+        if listener is not None:
+            listener.stop()
+        LOG.removeHandler(handler)
+        if tmpfile is not None:
+            with suppress(OSError):
+                remove(tmpfile)
+    response["log"] = handler.messages
+    return response
+
+
+def serve(
+    workers: int | None = None,
+    startmethod: str | None = None,
+    chunksize: int | None = None,
+) -> None:
+    """
+    Process jobs from stdin until end of input.
+
+    When a worker process dies, the pool can't be used any more. A new pool
+    is started and the job is tried once more, so only a job that kills a
+    worker again is reported as failed.
+
+    """
+    # the workers send their log records back through a managed queue, which
+    # every pool started here can use.
+    manager = get_context(startmethod).Manager()
+    logqueue = manager.Queue()
+    executor = proc_executor(workers, startmethod, logqueue)
+    try:
+        for line in sys.stdin:
+            if line.strip() == "":
+                continue
+            try:
+                job = json.loads(line)
+                if not isinstance(job, dict):
+                    raise ValueError("job must be a JSON object")
+            except ValueError as err:
+                response = {"id": None, "status": "error", "log": [str(err)]}
+            else:
+                response = {
+                    "id": job.get("id"),
+                    "status": "error",
+                    "log": ["a worker process died while processing the job"],
+                }
+                for _ in range(2):
+                    try:
+                        response = processjob(job, executor, logqueue, chunksize)
+                        break
+                    except BrokenProcessPool:
+                        LOG.warning("Note:  restarting process pool.")
+                        executor.shutdown(cancel_futures=True)
+                        executor = proc_executor(workers, startmethod, logqueue)
+            sys.stdout.write(f"{json.dumps(response)}\n")
+            sys.stdout.flush()
+    finally:
+        executor.shutdown()
+        manager.shutdown()
+
+
+# ---------------------------------------------------------------------------#
+
+
+if __name__ == "__main__":
+    PARSER = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description="""
+            convert USFM bibles to OSIS. Jobs are read from stdin as JSON lines.
+        """,
+        epilog=f"""
+            * Version: {META['VERSION']} * {META['DATE']} * This script is public domain. *
+        """,
+    )
+    PARSER.add_argument("-v", help="verbose output", action="store_true")
+    proc_poolargs(PARSER, serial=False, profile=False)
+    ARGS: argsNamespace = PARSER.parse_args()
+    proc_startup()
+
+    if not HAVELXML:
+        LOG.warning("Note:  lxml is not installed. Skipping OSIS validation.")
+
+    if ARGS.v:
+        LOG.setLevel(logging.INFO)
+
+    if ARGS.workers is not None and ARGS.workers < 1:
+        LOG.error("*** number of workers must be at least 1. ***")
+        sys.exit(1)
+    serve(ARGS.workers, ARGS.start_method, ARGS.chunk_size)
@@ -0,0 +1,76 @@
+"""
+Shared fixtures for the tests.
+
+The tests convert a small corpus of made up usfm books that is written to a
+temporary directory. Each book has several chapters so it can be split into
+chunks, and uses a mix of paragraphs, poetry, headings, notes and words of
+Jesus.
+
+"""
+
+from pathlib import Path
+
+import pytest
+
+# book id, name, number of chapters and the markup to use for each verse.
+BOOKS = (
+    ("GEN", "Genesis", 4, "prose"),
+    ("PSA", "Psalms", 3, "poetry"),
+    ("JHN", "John", 4, "gospel"),
+    ("JUD", "Jude", 1, "prose"),
+)
+
+TEXT = (
+    "And it came to pass in those days, that the people went up to the city, "
+    "and they \\add were\\add* glad"
+)
+
+
+def verse(style: str, chapter: int, num: int) -> list[str]:
+    """Get the usfm lines for a verse."""
+    text = f"{TEXT} in the {num} day of the {chapter} month."
+    if num == 2:
+        text += f" \\f + \\fr {chapter}:{num} \\ft Or, \\fq the people\\f*"
+    if num == 4:
+        text += f" \\x - \\xo {chapter}:{num} \\xt Gen 1:1\\x*"
+    if style == "poetry":
+        return [f"\\q1 \\v {num} {text}", "\\q2 and they sang for joy."]
+    if style == "gospel" and num % 3 == 0:
+        return [f"\\v {num} Jesus said, \\wj {text}\\wj*"]
+    return [f"\\v {num} {text}"]
+
+
+def usfmbook(bookid: str, name: str, chapters: int, style: str) -> str:
+    """Get the usfm text of a made up book."""
+    lines = [
+        f"\\id {bookid} Test corpus",
+        "\\ide UTF-8",
+        f"\\h {name}",
+        f"\\toc1 The Book of {name}",
+        f"\\toc2 {name}",
+        f"\\toc3 {name[:3]}",
+        f"\\mt1 {name}",
+    ]
+    for chapter in range(1, chapters + 1):
+        lines.extend((f"\\c {chapter}", f"\\s1 Heading {chapter}"))
+        if style == "poetry":
+            lines.append(f"\\d A psalm of the {chapter} month.")
+        for num in range(1, 9):
+            if num % 4 == 1 and style != "poetry":
+                lines.append("\\p")
+            if num == 5 and style == "poetry":
+                lines.append("\\b")
+            lines.extend(verse(style, chapter, num))
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture(name="corpus", scope="session")
+def fixture_corpus(tmp_path_factory: pytest.TempPathFactory) -> list[str]:
+    """File names of the test corpus."""
+    corpusdir = tmp_path_factory.mktemp("corpus")
+    fnames = []
+    for num, book in enumerate(BOOKS, 1):
+        fname = Path(corpusdir, f"{num:02}{book[0]}.usfm")
+        fname.write_text(usfmbook(*book), encoding="utf-8")
+        fnames.append(str(fname))
+    return fnames
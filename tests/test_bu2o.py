@@ -0,0 +1,43 @@
+"""
+Check that bu2o converts the rest of a batch when a work fails.
+
+"""
+
+import json
+import subprocess  # nosec
+import sys
+from os import path
+from pathlib import Path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+
+def test_failedwork(corpus: list[str], tmp_path: Path) -> None:
+    """Works that fail are reported, and the others are still written."""
+    badbook = path.join(tmp_path, "bad.usfm")
+    with open(badbook, "w", encoding="utf-8") as ofile:
+        ofile.write("\\id XYZ bad\n\\c 1\n\\p\n\\v 1 text\n")
+    works = [
+        {"workid": "First", "files": corpus[:2]},
+        {"workid": "Bad", "files": [corpus[2], badbook]},
+        {"workid": "Missing", "files": path.join(tmp_path, "none", "*.usfm")},
+        {"workid": "Last", "files": corpus[2:]},
+    ]
+    for work in works:
+        work["output"] = path.join(tmp_path, f"{work['workid']}.osis")
+    manifest = path.join(tmp_path, "manifest.json")
+    with open(manifest, "w", encoding="utf-8") as ofile:
+        json.dump(works, ofile)
+    result = subprocess.run(  # nosec
+        [sys.executable, path.join(ROOT, "bu2o.py"), manifest],
+        capture_output=True,
+        check=False,
+        text=True,
+    )
+    assert result.returncode == 1
+    assert "no input files found" in result.stderr
+    assert "Book id naming issue - XYZ" in result.stderr
+    assert not path.exists(works[1]["output"])
+    for work in (works[0], works[3]):
+        with open(work["output"], "r", encoding="utf-8") as ofile:
+            assert f'osisIDWork="{work["workid"]}"' in ofile.read()
@@ -0,0 +1,45 @@
+"""
+Check that cu2o splits a concatenated usfm file into the right books.
+
+"""
+
+import re
+import subprocess  # nosec
+import sys
+from os import path
+from pathlib import Path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+
+def convert(script: str, fnames: list[str], outfile: str) -> str:
+    """Convert files with a script and return the output without its date."""
+    subprocess.run(  # nosec
+        [sys.executable, path.join(ROOT, script), "TEST", "-o", outfile] + fnames,
+        capture_output=True,
+        check=True,
+    )
+    with open(outfile, "r", encoding="utf-8") as ofile:
+        return re.sub(r"<date>[^<]*</date>", "", ofile.read())
+
+
+def test_splitbooks(corpus: list[str], tmp_path: Path) -> None:
+    """A concatenated file gives the same output as its books in separate files."""
+    texts = [Path(_).read_text(encoding="utf-8") for _ in corpus]
+    # a repeated \id line for the same book doesn't start a new book.
+    texts[0] = texts[0].replace("\n", "\n\\id GEN again\n", 1)
+    fnames = [path.join(tmp_path, path.basename(_)) for _ in corpus]
+    for fname, text in zip(fnames, texts):
+        Path(fname).write_text(text, encoding="utf-8")
+    # text before the first book is dropped, and the last copy of a book is used.
+    concat = path.join(tmp_path, "concat.usfm")
+    with open(concat, "w", encoding="utf-8") as ofile:
+        ofile.write("\\rem not part of any book\n")
+        ofile.write(texts[0].replace("Heading", "Old heading"))
+        ofile.write("".join(texts[1:] + texts[:1]))
+    expected = convert("u2o.py", fnames, path.join(tmp_path, "books.osis"))
+    output = convert("cu2o.py", [concat], path.join(tmp_path, "concat.osis"))
+    assert output == expected
+    assert "GEN again" in output
+    assert "Old heading" not in output
+    assert "not part of any book" not in output
@@ -0,0 +1,75 @@
+"""
+Check the responses of the su2o conversion server.
+
+"""
+
+import json
+import logging
+import os
+import subprocess  # nosec
+import sys
+from io import StringIO
+from os import path
+from pathlib import Path
+
+import pytest
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+import su2o  # noqa: E402
+
+
+def test_workerlog(corpus: list[str], tmp_path: Path) -> None:
+    """Messages logged by the workers are included in the response."""
+    badbook = path.join(tmp_path, "bad.usfm")
+    with open(badbook, "w", encoding="utf-8") as ofile:
+        ofile.write("\\id XYZ bad\n\\c 1\n\\p\n\\v 1 text\n")
+    jobs = [
+        {"id": 1, "workid": "TEST", "files": [corpus[0], badbook]},
+        {"id": 2, "workid": "TEST", "files": corpus[:2]},
+    ]
+    result = subprocess.run(  # nosec
+        [sys.executable, path.join(ROOT, "su2o.py"), "--workers", "2"],
+        input="".join(f"{json.dumps(_)}\n" for _ in jobs),
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    responses = [json.loads(_) for _ in result.stdout.splitlines()]
+    assert [_["status"] for _ in responses] == ["error", "ok"]
+    assert "Book id naming issue - XYZ" in responses[0]["log"]
+    assert "Book id naming issue - XYZ" not in responses[1]["log"]
+    assert responses[1]["osis"].startswith("<?xml")
+
+
+def test_restart(
+    corpus: list[str],
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """A new pool is started and the job tried again when a worker dies."""
+    processfiles = su2o.processfiles
+    crashed: list[bool] = []
+
+    def crash(*args, executor, **kwargs) -> None:
+        if not crashed:
+            crashed.append(True)
+            executor.submit(os._exit, 1).result()
+        processfiles(*args, executor=executor, **kwargs)
+
+    jobs = [
+        {"id": 1, "workid": "TEST", "files": corpus[:2]},
+        {"id": 2, "workid": "TEST", "files": corpus[2:]},
+    ]
+    monkeypatch.setattr(su2o, "processfiles", crash)
+    monkeypatch.setattr(
+        sys, "stdin", StringIO("".join(f"{json.dumps(_)}\n" for _ in jobs))
+    )
+    with caplog.at_level(logging.WARNING):
+        su2o.serve(workers=2, startmethod="spawn")
+    responses = [json.loads(_) for _ in capsys.readouterr().out.splitlines()]
+    assert [_["status"] for _ in responses] == ["ok", "ok"]
+    assert "Note:  restarting process pool." in caplog.messages
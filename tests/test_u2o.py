@@ -0,0 +1,195 @@
+"""
+Check that the conversion options of u2o give the same output as the default.
+
+The test corpus is converted with the default options and with each
+option that changes how books are converted, and the OSIS documents are
+compared. The date in the header is ignored.
+
+"""
+
+import json
+import re
+import subprocess  # nosec
+import sys
+from glob import glob
+from os import path
+from pathlib import Path
+
+import pytest
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+
+def convert(corpus: list[str], outfile: str | Path, *options: str) -> str:
+    """Convert the corpus with u2o and return the output without its date."""
+    subprocess.run(  # nosec
+        [sys.executable, path.join(ROOT, "u2o.py"), "TEST", "-o", str(outfile)]
+        + list(options)
+        + corpus,
+        capture_output=True,
+        check=True,
+    )
+    with open(outfile, "r", encoding="utf-8") as ofile:
+        return re.sub(r"<date>[^<]*</date>", "", ofile.read())
+
+
+@pytest.fixture(name="default", scope="module")
+def fixture_default(corpus: list[str], tmp_path_factory: pytest.TempPathFactory) -> str:
+    """Output of a conversion with the default options."""
+    return convert(corpus, tmp_path_factory.mktemp("default") / "default.osis")
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        ("--serial",),
+        ("--workers", "1"),
+        ("--chunk-size", "1000"),
+        ("--start-method", "spawn", "--chunk-size", "1000"),
+    ],
+)
+def test_options(
+    corpus: list[str], default: str, tmp_path: Path, options: tuple[str, ...]
+) -> None:
+    """Options that only change how books are converted give the same output."""
+    assert convert(corpus, path.join(tmp_path, "out.osis"), *options) == default
+
+
+def test_cache(corpus: list[str], default: str, tmp_path: Path) -> None:
+    """Books converted on a cold and a warm cache give the same output."""
+    cachedir = path.join(tmp_path, "cache")
+    for name, options in (
+        ("cold", ()),
+        ("warm", ()),
+        ("chunks", ("--chunk-size", "1000")),
+    ):
+        outfile = path.join(tmp_path, f"{name}.osis")
+        assert convert(corpus, outfile, "--cache", cachedir, *options) == default
+        assert len(glob(path.join(cachedir, "*.json"))) == len(corpus)
+
+
+def canonical(text: str) -> str:
+    """Get canonical form of a document, ignoring whitespace around tags."""
+    etree = pytest.importorskip("lxml.etree")
+    text = etree.tostring(etree.fromstring(text.encode("utf-8")), method="c14n").decode(
+        "utf-8"
+    )
+    return re.sub(r"\s*(<[^>]*>)\s*", r"\1", re.sub(r"\s+", " ", text))
+
+
+def test_stream(corpus: list[str], default: str, tmp_path: Path) -> None:
+    """Streamed output is the same as the default apart from formatting."""
+    for options in (("--stream",), ("--stream", "--chunk-size", "1000")):
+        streamed = convert(corpus, path.join(tmp_path, "stream.osis"), *options)
+        assert canonical(streamed) == canonical(default)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # words of Jesus that continue into the next chapter.
+        "\\id MAT\n\\c 1\n\\p\n\\v 1 Jesus said, \\wj Come\n\\v 2 and see\n"
+        "\\c 2\n\\p\n\\v 1 the place.\\wj*\n",
+        # verses before the first chapter.
+        "\\id GEN\n\\p\n\\v 1 In the beginning\n\\c 1\n\\p\n\\v 1 God\n"
+        "\\c 2\n\\p\n\\v 1 created\n",
+        # no paragraph markup.
+        "\\id ROM\n\\c 1\n\\v 1 Paul, a servant\n\\c 2\n\\v 1 Therefore\n",
+    ],
+)
+def test_chunkseams(text: str, tmp_path: Path) -> None:
+    """Books whose chapters can't be processed separately are still converted the same."""
+    fname = path.join(tmp_path, "book.usfm")
+    with open(fname, "w", encoding="utf-8") as ofile:
+        ofile.write(text)
+    assert convert(
+        [fname], path.join(tmp_path, "chunks.osis"), "--chunk-size", "1"
+    ) == (convert([fname], path.join(tmp_path, "default.osis")))
+
+
+def test_streamtest(tmp_path: Path) -> None:
+    """Books without an id are printed the same with and without --stream."""
+    fname = path.join(tmp_path, "test.usfm")
+    with open(fname, "w", encoding="utf-8") as ofile:
+        ofile.write(
+            "\\c 1\n\\s1 Heading\n\\p\n\\v 1 Jesus said, \\wj Come\\wj* "
+            "\\f + \\fr 1:1 \\ft Or, \\fq the\\f*\n"
+            "\\q1 \\v 2 and they \\add were\\add* glad\n\\q2 and sang\n"
+        )
+    printed = [
+        subprocess.run(  # nosec
+            [sys.executable, path.join(ROOT, "u2o.py"), "TEST", "-o"]
+            + [path.join(tmp_path, "out.osis"), fname]
+            + list(options),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        for options in ((), ("--stream",))
+    ]
+    assert "TEST.1.2" in printed[0]
+    assert printed[1] == printed[0]
+
+
+def test_validatebooks(corpus: list[str], default: str, tmp_path: Path) -> None:
+    """Books validated separately give the same output and errors as the default."""
+    pytest.importorskip("lxml.etree")
+    for options in (("--validate-books",), ("--validate-books", "--stream")):
+        output = convert(corpus, path.join(tmp_path, "books.osis"), *options)
+        assert canonical(output) == canonical(default)
+
+    fname = path.join(tmp_path, "pre.usfm")
+    with open(fname, "w", encoding="utf-8") as ofile:
+        ofile.write("\\id GEN\n\\p\n\\v 1 In the beginning\n\\c 1\n\\p\n\\v 1 God\n")
+    errors = []
+    for options in ((), ("--validate-books",)):
+        errors.append(
+            [
+                re.sub(r"^Validation failed: (Gen )?line \d+: ", "", _)
+                for _ in subprocess.run(  # nosec
+                    [sys.executable, path.join(ROOT, "u2o.py"), "TEST", "-o"]
+                    + [path.join(tmp_path, "pre.osis"), fname]
+                    + list(options),
+                    capture_output=True,
+                    check=True,
+                    text=True,
+                ).stderr.splitlines()
+                if _.startswith("Validation")
+            ]
+        )
+    assert errors[0]
+    assert errors[1] == errors[0]
+
+
+@pytest.mark.parametrize("options", [(), ("--serial",), ("--chunk-size", "1000")])
+def test_profile(
+    corpus: list[str], default: str, tmp_path: Path, options: tuple[str, ...]
+) -> None:
+    """Profiling gives the same output, and a profile of every book."""
+    profiles = {}
+    for profileformat in ("json", "chrome"):
+        profiles[profileformat] = path.join(tmp_path, f"{profileformat}.json")
+        assert (
+            convert(
+                corpus,
+                path.join(tmp_path, "out.osis"),
+                "--profile",
+                "--profile-format",
+                profileformat,
+                "--profile-output",
+                profiles[profileformat],
+                *options,
+            )
+            == default
+        )
+    with open(profiles["json"], "r", encoding="utf-8") as ifile:
+        profile = json.load(ifile)
+    assert len(profile["books"]) == len(corpus)
+    for name, stats in profile["stages"].items():
+        assert stats["calls"] == sum(
+            _["stages"][name]["calls"] for _ in profile["books"] if name in _["stages"]
+        )
+    assert profile["stages"]["c2o_bookstart"]["calls"] == len(corpus)
+    with open(profiles["chrome"], "r", encoding="utf-8") as ifile:
+        events = json.load(ifile)["traceEvents"]
+    assert {_["args"]["book"] for _ in events} == {_["book"] for _ in profile["books"]}
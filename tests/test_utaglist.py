@@ -0,0 +1,66 @@
+"""
+Check the tag counts that utaglist writes as JSON and CSV.
+
+"""
+
+import csv
+import json
+import subprocess  # nosec
+import sys
+from collections import Counter
+from os import path
+from pathlib import Path
+
+import pytest
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+import utaglist  # noqa: E402
+
+
+def taglist(*args: str) -> str:
+    """Run utaglist and return what it writes."""
+    return subprocess.run(  # nosec
+        [sys.executable, path.join(ROOT, "utaglist.py")] + list(args),
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+
+
+def test_json(corpus: list[str]) -> None:
+    """Counts are given for each file and for all files together."""
+    result = json.loads(taglist("-f", "json", *corpus))
+    assert [_["file"] for _ in result["files"]] == corpus
+    for fname, counts in zip(corpus, result["files"]):
+        text = Path(fname).read_text(encoding="utf-8")
+        assert counts["tags"]["\\v"] == text.count("\\v ")
+        assert counts["count"] == sum(counts["tags"].values())
+    total: Counter[str] = Counter()
+    for counts in result["files"]:
+        total.update(counts["tags"])
+    assert result["total"]["tags"] == dict(total)
+    assert result["total"]["files"] == len(corpus)
+    assert result["unknown"] == []
+    assert result["known"] == sorted(total)
+
+
+def test_csv(corpus: list[str]) -> None:
+    """CSV output has the same counts as JSON output."""
+    result = json.loads(taglist("-f", "json", *corpus))
+    rows = list(csv.DictReader(taglist("-f", "csv", *corpus).splitlines()))
+    for fname, counts in [(_["file"], _["tags"]) for _ in result["files"]] + [
+        ("", result["total"]["tags"])
+    ]:
+        assert {_["tag"]: int(_["count"]) for _ in rows if _["file"] == fname} == counts
+    assert {_["known"] for _ in rows} == {"1"}
+
+
+def test_pieces(corpus: list[str], monkeypatch: pytest.MonkeyPatch) -> None:
+    """Files split into pieces give the same counts as whole files."""
+    counts = utaglist.censustags(corpus, None, True)
+    monkeypatch.setattr(utaglist, "PIECESIZE", 100)
+    assert all(len(utaglist.getpieces(_)) > 1 for _ in corpus)
+    assert utaglist.censustags(corpus, None, True) == counts
@@ -71,6 +71,7 @@ This script is public domain. You may do whatever you want with it.
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-positional-arguments
 # pylint: disable=consider-using-f-string
+# pylint: disable=import-outside-toplevel
 
 import re
 from argparse import (
@@ -79,33 +80,49 @@ from argparse import (
     Namespace as argsNamespace,
 )
 from codecs import decode, encode, lookup
-from concurrent.futures import ProcessPoolExecutor
-from contextlib import suppress
+from collections import deque
+from collections.abc import Container, Iterable, Iterator
+from concurrent.futures import Executor, Future
+from contextlib import nullcontext, suppress
 from datetime import datetime
-from functools import reduce
+from functools import cache, partial, reduce, wraps
 from gc import disable as gcdisable
 from glob import glob
-from io import StringIO
-from itertools import chain
+from importlib.util import find_spec
+from io import BytesIO, StringIO
+from itertools import chain, repeat
+from json import dump as jsondump, dumps as jsondumps, load as jsonload
 from logging import DEBUG, INFO, WARNING, basicConfig, getLogger, Logger
-from os import getenv
-from os.path import isfile
-from sys import exit as sysexit
-from tempfile import NamedTemporaryFile
-from unicodedata import normalize
-
-# try to import lxml so that we can validate
-# our output against the OSIS schema.
-HAVELXML = False
-with suppress(ImportError):
-    import lxml.etree as et  # nosec
-    HAVELXML = True
-
-# disable garbage collector as it's not needed for this converter
-gcdisable()
+from math import ceil
+from mmap import ACCESS_READ, mmap
+from os import cpu_count, fstat, getenv, getpid, makedirs, remove, replace
+from os.path import basename, expanduser, getsize, isfile, join as pathjoin
+from sys import exit as sysexit, stderr
+from shutil import copyfileobj
+from tempfile import NamedTemporaryFile, TemporaryDirectory, TemporaryFile, mkdtemp
+from threading import Lock
+from time import perf_counter
+from typing import Any, BinaryIO, Callable
+from unicodedata import is_normalized, normalize
+
+# check for lxml so that we can validate our output against the OSIS
+# schema. lxml itself is imported when output is validated.
+HAVELXML = find_spec("lxml") is not None
 
 WSTRANS = str.maketrans("\t\r\n", "   ")
 
+# whitespace removed from beginning and end of files, same as bytes.strip()
+WSBYTES = frozenset(b" \t\n\r\x0b\x0c")
+
+# number of bytes at start of file to look at for \ide line.
+IDESNIFF = 4096
+
+# cgroup v2 and v1 files giving the cpu quota and period of a container.
+CGROUPQUOTA: tuple[tuple[str, str], ...] = (
+    ("/sys/fs/cgroup{}/cpu.max", ""),
+    ("/sys/fs/cgroup/cpu{}/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu{}/cpu.cfs_period_us"),
+)
+
 # -------------------------------------------------------------------------- #
 
 META = {
@@ -146,6 +163,14 @@ OSISFOOTER = """
     </osisText>
 </osis>\n"""
 
+# minimal osis document used when validating books separately.
+OSISENVELOPE = (
+    '<osis xmlns="http://www.bibletechnologies.net/2003/OSIS/namespace">'
+    '<osisText osisIDWork="u2o" osisRefWork="Bible" xml:lang="und">'
+    '<header><work osisWork="u2o" /></header>',
+    "</osisText></osis>",
+)
+
 # -------------------------------------------------------------------------- #
 
 CANONICALORDER = (
@@ -268,18 +293,6 @@ CANONICALORDER = (
     "GAZETTEER",
     "X-OTHER",
 )
-# get list of book orders available from external files in the current
-# working directory.  Each order file has the following naming pattern:
-#    order-SOMEORDER.txt
-BOOKORDERS: tuple[str, ...] = tuple(
-    chain(
-        ["canonical"],
-        sorted(
-            [_.replace("order-", "").replace(".txt", "") for _ in glob("order-*.txt")]
-        ),
-        ["none"],
-    )
-)
 
 # -------------------------------------------------------------------------- #
 
@@ -964,9 +977,11 @@ DEFAULTATTRIBUTES = {
 }
 
 # -------------------------------------------------------------------------- #
+# regexes are kept as a pattern and flags, and compiled by getre the first
+# time they are used.
 
 # match z tags that have both a start and end marker
-ZTAGSRE: re.Pattern[str] = re.compile(
+ZTAGSPATTERN: tuple[str, int] = (
     r"""
         # put z tags that have a start and end marker into named group 'tag'
         (?P<tag>
@@ -991,7 +1006,7 @@ ZTAGSRE: re.Pattern[str] = re.compile(
 )
 
 # match milestone z tags
-ZTAGS2RE: re.Pattern[str] = re.compile(
+ZTAGS2PATTERN: tuple[str, int] = (
     r"""
     # put z tag content in a named group 'tag'
     (?P<tag>
@@ -1016,7 +1031,7 @@ ZTAGS2RE: re.Pattern[str] = re.compile(
 )
 # matches special feature tags
 # Automatically build SPECIALFEATURESRE regex string from FEATURETAGS dict.
-SPECIALFEATURESRE: re.Pattern[str] = re.compile(
+SPECIALFEATURESPATTERN: tuple[str, int] = (
     r"""
         # put the special features tags into a named group called 'tag'
         (?P<tag>
@@ -1044,9 +1059,15 @@ SPECIALFEATURESRE: re.Pattern[str] = re.compile(
     re.U + re.VERBOSE,
 )
 
-# regex used in footnote/crossref functions
-# Automatically build NOTERE regex string from NOTETAGS dict.
-NOTERE: re.Pattern[str] = re.compile(
+# regexes used in footnote/crossref functions
+# quick check for lines that may have footnotes or cross references. The
+# private use characters are left by footnotes that have been processed.
+NOTECHECKPATTERN: tuple[str, int] = (r"\\\+?[efx]|[\ufdd2\ufdd3]", 0)
+# ---
+# Automatically build NOTERE regex string from NOTETAGS dict. This only
+# matches the start of a footnote or cross reference, the end is found by
+# looking for the matching end tag.
+NOTEPATTERN: tuple[str, int] = (
     r"""
         # put the footnote and cross reference markers into a named group
         # called 'tag'
@@ -1067,22 +1088,24 @@ NOTERE: re.Pattern[str] = re.compile(
 
         # there is always at least one space following the caller
         \s+
-
-        # put the tag content into a named group called 'osis'
-        (?P<osis>.*?)
-
-        # footnote / cross reference end tag
-        (?P=tag)\*
     """.format(
-        "|".join([_.replace("\\", "") for _ in NOTETAGS if not _.startswith(r"\+")])
+        "|".join(
+            sorted(
+                [_[1:] for _ in NOTETAGS if not _.startswith(r"\+")],
+                key=len,
+                reverse=True,
+            )
+        )
     ),
     re.U + re.VERBOSE,
 )
 # ---
-# Automatically build NOTEFIXRE regex string from NOTETAGS2 dict.
-NOTEFIXRE: re.Pattern[str] = re.compile(
+# Automatically build NOTEFIXRE regex string from NOTETAGS2 dict. This
+# matches the start of a tag inside a footnote or cross reference, and the
+# content of the tag is found by looking for NOTEFIXENDRE.
+NOTEFIXPATTERN: tuple[str, int] = (
     r"""
-        (
+        (?P<tag>
             # tags always start with a backslash and may have a + symbol which
             # indicates that it's a nested character style.
             \\\+?
@@ -1094,22 +1117,76 @@ NOTEFIXRE: re.Pattern[str] = re.compile(
 
         # there is always at least one space following the tag.
         \s+
-
-        # This matches the content of the tag
-        (.*?)
-
-        # This marks the end of the tag. It matches against either the
-        # start of an additional tag or the end of the note.
-        (?=\\\+?[fx]|</note)
     """.format(
-        "|".join([_.replace("\\", "") for _ in NOTETAGS2 if not _.startswith(r"\+")])
+        "|".join(
+            sorted(
+                [_[1:] for _ in NOTETAGS2 if not _.startswith(r"\+")],
+                key=len,
+                reverse=True,
+            )
+        )
     ),
     re.U + re.VERBOSE,
 )
+# ---
+# This marks the end of the content of a tag inside a footnote or cross
+# reference. It matches against either the start of an additional tag or
+# the end of the note.
+NOTEFIXENDPATTERN: tuple[str, int] = (r"\\\+?[fx]|</note", 0)
+# ---
+# end tags removed from footnotes and cross references.
+NOTEENDPATTERN: tuple[str, int] = (
+    r"\\\+?(?:{})\*".format(
+        "|".join(
+            sorted(
+                (
+                    "fm",
+                    "fdc",
+                    "fr",
+                    "fk",
+                    "fq",
+                    "fqa",
+                    "fl",
+                    "fv",
+                    "ft",
+                    "xo",
+                    "xk",
+                    "xq",
+                    "xt",
+                    "xot",
+                    "xnt",
+                    "xdc",
+                ),
+                key=len,
+                reverse=True,
+            )
+        )
+    ),
+    0,
+)
+# ---
+# Automatically build SPECIALTEXTRE regex string from SPECIALTEXT dict.
+# SPECIALTEXTTAGS has the replacement for each start and end tag.
+SPECIALTEXTTAGS: dict[str, str] = {
+    tag: osis
+    for usfm, (starttag, endtag) in SPECIALTEXT.items()
+    for tag, osis in ((f"{usfm}*", endtag), (f"{usfm} ", starttag))
+}
+SPECIALTEXTPATTERN: tuple[str, int] = (
+    r"\\(?:{})".format("|".join([re.escape(_[1:]) for _ in SPECIALTEXTTAGS])),
+    0,
+)
+# ---
+# Automatically build OTHERTAGSRE regex string from OTHERTAGS dict. Where
+# more than one tag matches, the first one in OTHERTAGS is used.
+OTHERTAGSPATTERN: tuple[str, int] = (
+    r"\\(?:{})".format("|".join([re.escape(_[1:]) for _ in OTHERTAGS])),
+    0,
+)
 
 
 # regex for finding usfm tags
-USFMRE: re.Pattern[str] = re.compile(
+USFMPATTERN: tuple[str, int] = (
     r"""
     # the first character of a usfm tag is always a backslash
     \\
@@ -1153,6 +1230,73 @@ PARFLOW: set[str] = set(
 # poetry/prose tags... used by reflow subroutine below.
 # this is used by reflow to test if we have paragraph markup.
 PARCHECK: set[str] = {_ for _ in PARTAGS if _ not in (r"\iex", r"\ie", r"\qa")}
+PARCHECKPATTERN: tuple[str, int] = (
+    r"\\(?:{})".format("|".join([re.escape(_[1:]) for _ in sorted(PARCHECK)])),
+    0,
+)
+
+# ---
+# Automatically build REFLOWRE regex string from REFLOWTAGS dict.
+# REFLOWTAGS has the replacements reflow uses to put (almost) all paragraph
+# style tags on separate lines, add a newline after ie tags, and add a space
+# before cp and ca tags. None of the replacements create a new match for
+# another tag, so they can all be done in a single scan of the text.
+REFLOWTAGS: dict[str, str] = (
+    {f"{_} ": f"\n{_} " for _ in PARFLOW}
+    | {"\\ie ": "\n\\ie\n" if r"\ie" in PARFLOW else "\\ie\n"}
+    | {r"\cp": r" \cp", r"\ca": r" \ca"}
+)
+REFLOWPATTERN: tuple[str, int] = (
+    r"\\(?:{})".format(
+        "|".join(
+            [re.escape(_[1:]) for _ in sorted(REFLOWTAGS, key=lambda x: (-len(x), x))]
+        )
+    ),
+    0,
+)
+
+# lines that have verse tags moved onto a new line by reflow. These are
+# compared with the first word of a line, so only \s3 ever matches.
+FIXLINETAGS: set[str] = {
+    r"\is ",
+    r"\is1 ",
+    r"\is2 ",
+    r"\is3 ",
+    r"\is4 ",
+    r"\is5 ",
+    r"\ms ",
+    r"\ms1 ",
+    r"\ms2 ",
+    r"\ms3 ",
+    r"\ms4 ",
+    r"\ms5 ",
+    r"\s ",
+    r"\s1 ",
+    r"\s2 ",
+    r"\s3",
+    r"\s4 ",
+    r"\s5 ",
+    r"\th ",
+    r"\th1 ",
+    r"\th2 ",
+    r"\th3 ",
+    r"\th4 ",
+    r"\th5 ",
+    r"\th6 ",
+    r"\th7 ",
+    r"\th8 ",
+    r"\th9 ",
+    r"\tc ",
+    r"\tc1 ",
+    r"\tc2 ",
+    r"\tc3 ",
+    r"\tc4 ",
+    r"\tc5 ",
+    r"\tc6 ",
+    r"\tc7 ",
+    r"\tc8 ",
+    r"\tc9 ",
+}
 
 # -------------------------------------------------------------------------- #
 # VARIABLES USED BY POSTPROCESS ROUTINE
@@ -1164,6 +1308,31 @@ OSISL: set[str] = set(
     chain({_[0] for _ in PARTAGS.items() if _[0].startswith("<l ")}, ["<l>"])
 )
 
+# start of the tag a line begins with, used as the kind of postprocessing nodes.
+NODEPATTERN: tuple[str, int] = (r"<(?:(?:verse|chapter) [se]ID|!--?.|/?[A-Za-z]+.?)", 0)
+
+# -------------------------------------------------------------------------- #
+# VARIABLES USED BY PROFILING ROUTINES
+
+# stages called once per line by c2o_booklines. These are left out of
+# chrome traces since there would be an event for every line of every book.
+PROFILELINESTAGES: frozenset[str] = frozenset(
+    {
+        "c2o_identification",
+        "c2o_specialtext",
+        "c2o_specialfeatures",
+        "c2o_noterefmarkers",
+        "c2o_ztags",
+        "c2o_titlepar",
+    }
+)
+
+# statistics and trace events for the book being profiled, and the running
+# stages with the memory in use when each started and their peak so far.
+PROFILESTATS: dict[str, list[float]] = {}
+PROFILEEVENTS: list[tuple[str, float, float]] = []
+PROFILESTACK: list[list[int]] = []
+
 # -------------------------------------------------------------------------- #
 
 # xml 1.1 schema...
@@ -1333,14 +1502,49 @@ OFCQJyEEPw==
 
 # -------------------------------------------------------------------------- #
 
-# logging.basicConfig(format="%(levelname)s: %(message)s")
-basicConfig(format="%(message)s")
 LOG: Logger = getLogger(__name__)
 LOG.setLevel(WARNING)
 
 # -------------------------------------------------------------------------- #
 
 
+@cache
+def getre(regex: tuple[str, int]) -> re.Pattern[str]:
+    """
+    Compile a regex the first time it is used.
+
+    Regexes are kept as a pattern and flags until they are needed, so that
+    starting u2o doesn't spend time compiling regexes that aren't used.
+
+    """
+    return re.compile(*regex)
+
+
+def __getattr__(name: str) -> re.Pattern[str]:
+    """
+    Get a compiled regex by name, such as USFMRE for USFMPATTERN.
+
+    This keeps u2o.USFMRE and the other regexes usable as compiled regexes
+    by scripts that import them, while still compiling them on first use.
+
+    """
+    pattern = globals().get(f"{name[:-2]}PATTERN") if name.endswith("RE") else None
+    if not isinstance(pattern, tuple):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getre(pattern)
+
+
+def replacetags(tagre: re.Pattern[str], tags: dict[str, str], text: str) -> str:
+    """
+    Replace tags in text using a table of replacements.
+
+    tagre matches every key of tags, so all tags are replaced in a single
+    scan of the text instead of a str.replace for each key of tags.
+
+    """
+    return tagre.sub(lambda _: tags[_[0]], text)
+
+
 def squeeze(text: str) -> str:
     """
     Squeeze whitespace characters into a single space.
@@ -1395,10 +1599,6 @@ def reflow(flowtext: str) -> str:
     # titlepar function operates!                                             #
     # ####################################################################### #
 
-    def manglecheck(text: str) -> bool:
-        """Check to see if we have paragraph markup."""
-        return any((_ in text) for _ in PARCHECK)
-
     def endmark(text: str) -> str:
         """Mark end of cl, sp, and qa tags."""
         return "\n".join(
@@ -1411,57 +1611,13 @@ def reflow(flowtext: str) -> str:
             ]
         )
 
-    def reflowpar(text: str) -> str:
-        """Put (almost) all paragraph tags on separate lines."""
-        return reduce(lambda x, y: x.replace(f"{y} ", f"\n{y} "), PARFLOW, text)
-
     def fixlines(text: str) -> str:
         """Fix various potential issues with lines of text."""
         return "\n".join(
             [
                 (
                     _.replace("\\v ", "\n\v ")
-                    if _.split(" ", maxsplit=1)[0]
-                    in {
-                        r"\is ",
-                        r"\is1 ",
-                        r"\is2 ",
-                        r"\is3 ",
-                        r"\is4 ",
-                        r"\is5 ",
-                        r"\ms ",
-                        r"\ms1 ",
-                        r"\ms2 ",
-                        r"\ms3 ",
-                        r"\ms4 ",
-                        r"\ms5 ",
-                        r"\s ",
-                        r"\s1 ",
-                        r"\s2 ",
-                        r"\s3",
-                        r"\s4 ",
-                        r"\s5 ",
-                        r"\th ",
-                        r"\th1 ",
-                        r"\th2 ",
-                        r"\th3 ",
-                        r"\th4 ",
-                        r"\th5 ",
-                        r"\th6 ",
-                        r"\th7 ",
-                        r"\th8 ",
-                        r"\th9 ",
-                        r"\tc ",
-                        r"\tc1 ",
-                        r"\tc2 ",
-                        r"\tc3 ",
-                        r"\tc4 ",
-                        r"\tc5 ",
-                        r"\tc6 ",
-                        r"\tc7 ",
-                        r"\tc8 ",
-                        r"\tc9 ",
-                    }
+                    if _.split(" ", maxsplit=1)[0] in FIXLINETAGS
                     else _
                 )
                 for _ in text.splitlines()
@@ -1469,18 +1625,16 @@ def reflow(flowtext: str) -> str:
         )
 
     # test for paragraph markup before mangling the text
-    mangletext = manglecheck(flowtext)
+    mangletext = getre(PARCHECKPATTERN).search(flowtext) is not None
 
     # remove leading and trailing whitespace, mark end of cl sp and qa tags.
     # prepare to process text with paragraph formatting
-    # put (almost) all paragraph style tags on separate lines
+    # put (almost) all paragraph style tags on separate lines, and
     # always add space before \cp and \ca tags, and newlines after \ie
     # fix various possible issues in text lines.
     flowtext = fixlines(
-        reduce(
-            lambda x, y: x.replace(y[0], y[1]),
-            ((r"\ie ", "\\ie\n"), (r"\cp", r" \cp"), (r"\ca", r" \ca")),
-            reflowpar(squeeze(endmark(flowtext.strip()))),
+        replacetags(
+            getre(REFLOWPATTERN), REFLOWTAGS, squeeze(endmark(flowtext.strip()))
         )
     )
 
@@ -1489,12 +1643,15 @@ def reflow(flowtext: str) -> str:
         # force some things  onto newlines.
         flowtext = flowtext.replace("\\c ", "\n\\c ").replace("\\v ", "\n\\v ")
 
-        # make sure all lines start with a usfm tag...
-        lines = flowtext.splitlines()
-        for _ in range(len(lines) - 1, 0, -1):
-            if not lines[_].startswith("\\"):
-                lines[_ - 1] = f"{lines[_ - 1]} {lines.pop(_)}"
-        flowtext = "\n".join(lines)
+        # make sure all lines start with a usfm tag by joining lines that
+        # don't to the line before them.
+        lines: list[list[str]] = []
+        for line in flowtext.splitlines():
+            if lines and not line.startswith("\\"):
+                lines[-1].append(line)
+            else:
+                lines.append([line])
+        flowtext = "\n".join([" ".join(_) for _ in lines])
 
         # remove some newlines that we don't want...
         flowtext = (
@@ -1514,6 +1671,18 @@ def getencoding(text: bytes) -> str:
     return "utf_8_sig" if not lines else lines[0].partition(" ")[2].lower().strip()
 
 
+def getbookid(text: str) -> str:
+    """Get book id from text. Returns TEST if there is no id line."""
+    lines = [_ for _ in text.splitlines() if _.startswith("\\id ")]
+    return (
+        "TEST"
+        if not lines
+        else BOOKNAMES.get(
+            lines[0].split()[1].strip(), f"* {lines[0].split()[1].strip()}"
+        )
+    )
+
+
 def markintroend(lines: list[str]) -> list[str]:
     """
     Mark end of introductions.
@@ -1778,8 +1947,7 @@ def c2o_titlepar(blocktext: str) -> str:
     )
 
     # other title, paragraph, intro tags
-    for _ in OTHERTAGS.items():
-        blocktext = blocktext.replace(_[0], _[1])
+    blocktext = replacetags(getre(OTHERTAGSPATTERN), OTHERTAGS, blocktext)
 
     # return our processed text
     return blocktext if "<selah>" not in blocktext else selah(blocktext)
@@ -1853,27 +2021,29 @@ def c2o_specialtext(text: str) -> str:
     * lit tags are handled in the titlepar function
 
     """
-    for i in SPECIALTEXT.items():
-        if i[0] not in text:
-            continue
-        text = text.replace(f"{i[0]}*", i[1][1]).replace(f"{i[0]} ", i[1][0])
-    return text
+    return replacetags(getre(SPECIALTEXTPATTERN), SPECIALTEXTTAGS, text)
 
 
 def c2o_noterefmarkers(text: str) -> str:
-    """Process footnote and cross reference markers."""
+    """
+    Process footnote and cross reference markers.
+
+    Lines without footnotes or cross references are skipped after a quick
+    check. Otherwise the start of each footnote and of each tag inside it is
+    found with a regex, and the end is found by searching forward for the
+    end tag, so the text of the note is only scanned once.
+
+    """
 
     def notefix(notetext: str) -> str:
         """Additional footnote and cross reference tag processing."""
 
-        def notefixsub(fnmatch: re.Match[str]) -> str:
-            """Simple regex replacement helper function."""
-            tag = list(NOTETAGS2[fnmatch.groups()[0]])
+        def notefixsub(tagname: str, tagtext: str) -> str:
+            """Simple replacement helper function."""
+            tag = list(NOTETAGS2[tagname])
             attrtxt: str
             txt, _, attrtxt = (
-                (fnmatch.groups()[1].partition("|"))
-                if "<reference>" in tag
-                else (fnmatch.groups()[1], "", "")
+                (tagtext.partition("|")) if "<reference>" in tag else (tagtext, "", "")
             )
             # try to convert usfm reference attributes to osisRef
             if "<reference" in tag:
@@ -1915,49 +2085,30 @@ def c2o_noterefmarkers(text: str) -> str:
                 txt = f"<!-- USFM Attributes: {attrtxt} -->{txt}"
             return "".join([tag[0], txt, tag[1]])
 
-        return reduce(
-            lambda x, y: x.replace(y, ""),
-            [
-                r"\fm*",
-                r"\fdc*",
-                r"\fr*",
-                r"\fk*",
-                r"\fq*",
-                r"\fqa*",
-                r"\fl*",
-                r"\fv*",
-                r"\ft*",
-                r"\xo*",
-                r"\xk*",
-                r"\xq*",
-                r"\xt*",
-                r"\xot*",
-                r"\xnt*",
-                r"\xdc*",
-                r"\+fm*",
-                r"\+fdc*",
-                r"\+fr*",
-                r"\+fk*",
-                r"\+fq*",
-                r"\+fqa*",
-                r"\+fl*",
-                r"\+fv*",
-                r"\+ft*",
-                r"\+xo*",
-                r"\+xk*",
-                r"\+xq*",
-                r"\+xt*",
-                r"\+xot*",
-                r"\+xnt*",
-                r"\+xdc*",
-            ],
-            NOTEFIXRE.sub(notefixsub, notetext, 0),
-        )
-
-    def simplerepl(match: re.Match[str]) -> str:
-        """Simple regex replacement helper function."""
-        tag = NOTETAGS[match.group("tag")]
-        notetext = match.group("osis").replace("\n", " ")
+        # the text of a tag runs until the next tag or the end of the note,
+        # but not past the end of the line.
+        parts: list[str] = []
+        pos = start = 0
+        notefixre, notefixendre = getre(NOTEFIXPATTERN), getre(NOTEFIXENDPATTERN)
+        while (match := notefixre.search(notetext, start)) is not None:
+            end = notefixendre.search(notetext, match.end())
+            if end is None:
+                break
+            if "\n" in notetext[match.end() : end.start()]:
+                start = match.start() + 1
+                continue
+            parts.append(notetext[pos : match.start()])
+            parts.append(
+                notefixsub(match.group(1), notetext[match.end() : end.start()])
+            )
+            pos = start = end.start()
+        parts.append(notetext[pos:])
+        return getre(NOTEENDPATTERN).sub("", "".join(parts))
+
+    def simplerepl(tagname: str, notetext: str) -> str:
+        """Simple replacement helper function."""
+        tag = NOTETAGS[tagname]
+        notetext = notetext.replace("\n", " ")
         if "<transChange" in notetext:
             notetext = notetext.replace(
                 '<transChange type="added">',
@@ -1965,16 +2116,35 @@ def c2o_noterefmarkers(text: str) -> str:
             ).replace("</transChange>", "</transChange></seg>")
         return f"{tag[0]}{notetext}{tag[1]}"
 
-    text = notefix(NOTERE.sub(simplerepl, text, 0))
-
-    # handle fp tags
-    text = (
-        text.replace("\ufdd2", "<p>")
-        .replace("\ufdd3", "</p>")
-        .replace(r"\fp ", r"</p><p>")
-        if r"\fp " in text
-        else text.replace("\ufdd2", "").replace("\ufdd3", "")
-    )
+    def notes(notetext: str) -> str:
+        """Process footnotes and cross references."""
+        # notes end at the first matching end tag on the same line.
+        parts: list[str] = []
+        pos = start = 0
+        notere = getre(NOTEPATTERN)
+        while (match := notere.search(notetext, start)) is not None:
+            tagname = match.group("tag")
+            end = notetext.find(f"{tagname}*", match.end())
+            if end == -1 or "\n" in notetext[match.end() : end]:
+                start = match.start() + 1
+                continue
+            parts.append(notetext[pos : match.start()])
+            parts.append(simplerepl(tagname, notetext[match.end() : end]))
+            pos = start = end + len(tagname) + 1
+        parts.append(notetext[pos:])
+        return "".join(parts)
+
+    if getre(NOTECHECKPATTERN).search(text) is not None:
+        text = notefix(notes(text))
+
+        # handle fp tags
+        text = (
+            text.replace("\ufdd2", "<p>")
+            .replace("\ufdd3", "</p>")
+            .replace(r"\fp ", r"</p><p>")
+            if r"\fp " in text
+            else text.replace("\ufdd2", "").replace("\ufdd3", "")
+        )
 
     # return our processed text handling \cat if necessary
     return (
@@ -2243,7 +2413,9 @@ def c2o_specialfeatures(specialtext: str) -> str:
         # rejoin lines
         return "".join(tlines)
 
-    return milestonequotes(figtags(SPECIALFEATURESRE.sub(simplerepl, specialtext, 0)))
+    return milestonequotes(
+        figtags(getre(SPECIALFEATURESPATTERN).sub(simplerepl, specialtext, 0))
+    )
 
 
 def c2o_ztags(text: str) -> str:
@@ -2266,7 +2438,9 @@ def c2o_ztags(text: str) -> str:
         return "".join([" <!-- ", match.group("tag").replace("\\z", ""), "--> "])
 
     if r"\z" in text:
-        text = ZTAGS2RE.sub(simplerepl2, ZTAGSRE.sub(simplerepl, text, 0), 0)
+        text = getre(ZTAGS2PATTERN).sub(
+            simplerepl2, getre(ZTAGSPATTERN).sub(simplerepl, text, 0), 0
+        )
         if r"\z" in text:
             # milestone z tags… this may need more work…
             text = " ".join(
@@ -2529,208 +2703,280 @@ def post_tagadjust(lines: list[str]) -> list[str]:
     # remove empty l tags
     lines = [_ for _ in lines if _ != '<l level="1"> </l>']
     # move lb and lg to their own lines
-    for i in range(len(lines) - 1, 0, -1):
-        if lines[i].endswith('<lb type="x-p" />'):
-            lines.insert(i + 1, '<lb type="x-p" />')
-            lines[i] = lines[i].rpartition('<lb type="x-p" />')[0].strip()
-        if lines[i].endswith("<lg>"):
-            lines.insert(i + 1, "<lg>")
-            lines[i] = lines[i].rpartition("<lg>")[0].strip()
-    return [_ for _ in lines if _ != ""]
+    newlines = lines[:1]
+    for line in lines[1:]:
+        moved = []
+        if line.endswith('<lb type="x-p" />'):
+            moved.append('<lb type="x-p" />')
+            line = line.rpartition('<lb type="x-p" />')[0].strip()
+        if line.endswith("<lg>"):
+            moved.append("<lg>")
+            line = line.rpartition("<lg>")[0].strip()
+        newlines.append(line)
+        newlines.extend(reversed(moved))
+    return [_ for _ in newlines if _ != ""]
+
+
+def post_nodes(lines: list[str]) -> list[tuple[str, str]]:
+    """
+    Convert lines to the nodes used for the rest of postprocessing.
+
+    Each node is a tuple of the kind of line and the line itself. The kind
+    is the start of the tag the line begins with, up to and including the
+    character after the tag name, like '<l ', '</p>' or '<!-- '. Verse and
+    chapter milestones also include their sID or eID, and lines that don't
+    start with a tag have an empty kind. Testing whether a line starts with
+    a tag can then be done using the much shorter kind.
+
+    """
+    nodere = getre(NODEPATTERN)
+    return [makenode(_, nodere) for _ in lines]
+
+
+def makenode(line: str, nodere: re.Pattern[str] | None = None) -> tuple[str, str]:
+    """Get the node for a line."""
+    kind = (nodere or getre(NODEPATTERN)).match(line)
+    return (kind.group() if kind is not None else "", line)
 
 
-def post_swap_lblg(lines: list[str]) -> list[str]:
+def post_swap_lblg(nodes: list[tuple[str, str]]) -> list[tuple[str, str]]:
     """Swap lb and lg tags when lg end tag follows lb."""
-    for i in range(len(lines) - 1, 0, -1):
-        with suppress(IndexError):
-            if lines[i] == '<lb type="x-p" />' and lines[i + 1] == "</lg>":
-                lines[i], lines[i + 1] = (lines[i + 1], lines[i])
-    return [_ for _ in lines if _ != ""]
+    for i in range(len(nodes) - 2, 0, -1):
+        if nodes[i][1] == '<lb type="x-p" />' and nodes[i + 1][1] == "</lg>":
+            nodes[i], nodes[i + 1] = (nodes[i + 1], nodes[i])
+    return nodes
 
 
-def post_verseend(lines: list[str]) -> list[str]:
-    """Adjust placement of verse end tags."""
-    for i in (_ for _ in range(len(lines)) if lines[_].startswith("<verse eID")):
-        if lines[i - 1].strip() in OSISL or lines[i - 1].strip() in OSISITEM:
-            lines.insert(i - 1, lines.pop(i))
-        elif lines[i - 1] == "<row><cell>" and lines[i - 2] == "<table>":
-            lines.insert(i - 2, lines.pop(i))
-
-    for i, j in (
-        (x, y)
-        for x in (
-            "<p",
-            "<lb ",
-            "</p>",
-            "<lg",
-            "<lb ",
-            "</lg>",
-            "<item",
-            "</item",
-            "<list",
-            "<lb",
-            "</list>",
-            "<title",
-            "<title",
-            "<title",
-            "<title",
-            "<title",
-            "<div",
-            "</div>",
-            "<lb ",
-            "</p>",
-            "</l",
-            "</lg>",
-            "<lb",
-            "</list>",
-            "<lb",
-            "</p>",
-            "</div>",
-        )
-        for y in (_ for _ in range(len(lines)) if lines[_].startswith("<verse eID"))
-    ):
-        if lines[j - 1].startswith(i):
-            lines.insert(j - 1, lines.pop(j))
-        elif i == "<title":
-            if lines[j - 1].startswith("<!-- ") and i in lines[j - 1]:
-                lines.insert(j - 1, lines.pop(j))
-
-    for i, j in (
-        (x, y)
-        for x in ("</l>", "</item>")
-        for y in (_ for _ in range(len(lines)) if lines[_].startswith("<verse eID"))
-    ):
-        if lines[j - 1].endswith(i):
-            tmp = lines[j - 1].rpartition("<")
-            lines[j - 1], lines[j] = (f"{tmp[0]}{lines[j]}{tmp[1]}{tmp[2]}", "")
+def post_verseend(nodes: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    """
+    Adjust placement of verse end tags.
 
-    for i in (_ for _ in range(len(lines)) if lines[_].startswith("<verse eID")):
+    Verse end tags are only ever moved back past lines that are not verse
+    end tags, so a list of their positions is kept up to date as they move
+    and each pass only looks at the verse end tags instead of every line.
+
+    """
+    ends = [_ for _ in range(len(nodes)) if nodes[_][0] == "<verse eID"]
+    for k, i in enumerate(ends):
+        if nodes[i - 1][1].strip() in OSISL or nodes[i - 1][1].strip() in OSISITEM:
+            nodes[i - 1], nodes[i] = nodes[i], nodes[i - 1]
+            ends[k] = i - 1
+        elif nodes[i - 1][1] == "<row><cell>" and nodes[i - 2][1] == "<table>":
+            nodes[i - 2], nodes[i - 1], nodes[i] = nodes[i], nodes[i - 2], nodes[i - 1]
+            ends[k] = i - 2
+
+    # verse end tags only move past lines starting with one of these tags.
+    tags = (
+        "<p",
+        "<lb ",
+        "</p>",
+        "<lg",
+        "<lb ",
+        "</lg>",
+        "<item",
+        "</item",
+        "<list",
+        "<lb",
+        "</list>",
+        "<title",
+        "<title",
+        "<title",
+        "<title",
+        "<title",
+        "<div",
+        "</div>",
+        "<lb ",
+        "</p>",
+        "</l",
+        "</lg>",
+        "<lb",
+        "</list>",
+        "<lb",
+        "</p>",
+        "</div>",
+    )
+    # verse end tags that follow any other line never move, since the line
+    # in front of them only changes when they move, or when it is another
+    # verse end tag that moves.
+    moving = [
+        _
+        for _ in range(len(ends))
+        if nodes[ends[_] - 1][0].startswith(tags)
+        or nodes[ends[_] - 1][0] in {"<!-- ", "<verse eID"}
+    ]
+    for tag in tags:
+        for k in moving:
+            i = ends[k]
+            if nodes[i - 1][0].startswith(tag) or (
+                tag == "<title"
+                and nodes[i - 1][0] == "<!-- "
+                and tag in nodes[i - 1][1]
+            ):
+                nodes[i - 1], nodes[i] = nodes[i], nodes[i - 1]
+                ends[k] = i - 1
+
+    for tag in ("</l>", "</item>"):
+        newends: list[int] = []
+        for i in ends:
+            if nodes[i - 1][1].endswith(tag):
+                tmp = nodes[i - 1][1].rpartition("<")
+                nodes[i - 1], nodes[i] = (
+                    makenode(f"{tmp[0]}{nodes[i][1]}{tmp[1]}{tmp[2]}"),
+                    ("", ""),
+                )
+                # the joined line only counts as a verse end tag if it starts
+                # with one, and then only once.
+                i -= 1
+                if nodes[i][0] != "<verse eID" or i in newends[-1:]:
+                    continue
+            newends.append(i)
+        ends = newends
+
+    for i in ends:
         with suppress(IndexError):
             if (
-                lines[i + 1].startswith("<verse sID")
-                and lines[i - 1].startswith("<l ")
-                and lines[i - 2].endswith("</l>")
+                nodes[i + 1][0] == "<verse sID"
+                and nodes[i - 1][0] == "<l "
+                and nodes[i - 2][1].endswith("</l>")
             ):
-                tmp = lines[i - 2].rpartition("<")
-                lines[i - 2], lines[i] = (f"{tmp[0]}{lines[i]}<{tmp[2]}", "")
+                tmp = nodes[i - 2][1].rpartition("<")
+                nodes[i - 2], nodes[i] = (
+                    makenode(f"{tmp[0]}{nodes[i][1]}<{tmp[2]}"),
+                    ("", ""),
+                )
             if (
-                lines[i + 1].startswith("<verse sID")
-                and lines[i - 1].startswith("<l ")
-                and lines[i - 2].startswith("<lg")
-                and lines[i - 3].startswith("</lg")
-                and lines[i - 4].endswith("</l>")
+                nodes[i + 1][0] == "<verse sID"
+                and nodes[i - 1][0] == "<l "
+                and nodes[i - 2][0].startswith("<lg")
+                and nodes[i - 3][0].startswith("</lg")
+                and nodes[i - 4][1].endswith("</l>")
             ):
-                tmp = lines[i - 4].rpartition("<")
-                lines[i - 4], lines[i] = (f"{tmp[0]}{lines[i]}<{tmp[2]}", "")
+                tmp = nodes[i - 4][1].rpartition("<")
+                nodes[i - 4], nodes[i] = (
+                    makenode(f"{tmp[0]}{nodes[i][1]}<{tmp[2]}"),
+                    ("", ""),
+                )
             if (
-                lines[i + 1].startswith("<verse sID")
-                and lines[i - 1].startswith("<l ")
-                and lines[i - 2].startswith("<lg")
-                and lines[i - 3] == "</p>"
+                nodes[i + 1][0] == "<verse sID"
+                and nodes[i - 1][0] == "<l "
+                and nodes[i - 2][0].startswith("<lg")
+                and nodes[i - 3][1] == "</p>"
             ):
-                lines.insert(i - 3, lines.pop(i))
-    return [_ for _ in lines if _ != ""]
+                nodes[i - 3], nodes[i - 2], nodes[i - 1], nodes[i] = (
+                    nodes[i],
+                    nodes[i - 3],
+                    nodes[i - 2],
+                    nodes[i - 1],
+                )
+    return [_ for _ in nodes if _[1] != ""]
 
 
-def post_versestart(lines: list[str]) -> list[str]:
+def post_versestart(nodes: list[tuple[str, str]]) -> list[tuple[str, str]]:
     """Adjust placement of some verse start tags...
     This is only to make sure they are properly nested inside paragraph markers!"""
-    for i in (_ for _ in range(len(lines)) if lines[_].startswith("<verse sID")):
-        with suppress(IndexError):
-            if lines[i + 1].startswith("</p") and lines[i + 2].startswith("<p"):
-                lines.insert(i + 2, lines.pop(i))
-    return [_ for _ in lines if _ != ""]
+    for i in range(len(nodes) - 2):
+        if (
+            nodes[i][0] == "<verse sID"
+            and nodes[i + 1][0].startswith("</p")
+            and nodes[i + 2][0].startswith("<p")
+        ):
+            nodes[i], nodes[i + 1], nodes[i + 2] = nodes[i + 1], nodes[i + 2], nodes[i]
+    return nodes
 
 
-def post_selahlgl(lines: list[str]) -> list[str]:
+def post_selahlgl(nodes: list[tuple[str, str]]) -> list[tuple[str, str]]:
     """Fix problems with selah and l or lg tags."""
-    for i in (_ for _ in range(len(lines)) if lines[_].startswith("<chapter sID")):
+    for i in (_ for _ in range(len(nodes)) if nodes[_][0] == "<chapter sID"):
         if (
-            lines[i].endswith("</l>")
-            and lines[i + 1] == "</lg>"
-            and lines[i - 1].startswith("<chapter eID")
-            and lines[i - 2].startswith("<verse eID")
-            and lines[i - 3].endswith("</l><l>")
+            nodes[i][1].endswith("</l>")
+            and nodes[i + 1][1] == "</lg>"
+            and nodes[i - 1][0] == "<chapter eID"
+            and nodes[i - 2][0] == "<verse eID"
+            and nodes[i - 3][1].endswith("</l><l>")
         ):
-            lines[i - 3], lines[i - 2], lines[i], lines[i + 1] = (
-                lines[i - 3][:-3],
-                f"{lines[i - 2]}</lg>",
-                lines[i][:-4],
-                "",
+            nodes[i - 3], nodes[i - 2], nodes[i], nodes[i + 1] = (
+                makenode(nodes[i - 3][1][:-3]),
+                makenode(f"{nodes[i - 2][1]}</lg>"),
+                makenode(nodes[i][1][:-4]),
+                ("", ""),
             )
-    return [_ for _ in lines if _ != ""]
+    return [_ for _ in nodes if _[1] != ""]
 
 
-def post_lgl(lines: list[str]) -> list[str]:
+def post_lgl(nodes: list[tuple[str, str]]) -> list[tuple[str, str]]:
     """Fix additional things with lg and l tags."""
-    for i in (_ for _ in range(len(lines)) if lines[_].startswith("<chapter sID")):
+    for i in (_ for _ in range(len(nodes)) if nodes[_][0] == "<chapter sID"):
         if (
-            lines[i].endswith("</l>")
-            and lines[i - 1].startswith("<chapter eID")
-            and lines[i + 1] == "</lg>"
+            nodes[i][1].endswith("</l>")
+            and nodes[i - 1][0] == "<chapter eID"
+            and nodes[i + 1][1] == "</lg>"
         ):
-            lines[i - 2], lines[i], lines[i + 1] = (
-                f"{lines[i - 2]}</l></lg>",
-                lines[i][:-4],
-                "",
+            nodes[i - 2], nodes[i], nodes[i + 1] = (
+                makenode(f"{nodes[i - 2][1]}</l></lg>"),
+                makenode(nodes[i][1][:-4]),
+                ("", ""),
             )
-    return [_ for _ in lines if _ != ""]
+    return [_ for _ in nodes if _[1] != ""]
 
 
-def post_dverse(lines: list[str]) -> list[str]:
+def post_dverse(nodes: list[tuple[str, str]]) -> list[tuple[str, str]]:
     """Fix placement of verse tags in relation to d titles with verses."""
-    for i in (_ for _ in range(len(lines)) if lines[_].startswith("<!-- d -->")):
+    for i in (
+        _
+        for _ in range(len(nodes))
+        if nodes[_][0] == "<!-- " and nodes[_][1].startswith("<!-- d -->")
+    ):
         if (
-            lines[i + 1].startswith("<verse sID")
-            and lines[i + 1].endswith("</title>")
-            and lines[i + 2].startswith("<verse eID")
+            nodes[i + 1][0] == "<verse sID"
+            and nodes[i + 1][1].endswith("</title>")
+            and nodes[i + 2][0] == "<verse eID"
         ):
-            tmp1 = lines[i + 1].rpartition("<")
-            lines[i], lines[i + 1], lines[i + 2] = (
-                f"{lines[i]}{tmp1[0]}{lines[i+2]}</title>",
-                "",
-                "",
+            tmp1 = nodes[i + 1][1].rpartition("<")
+            nodes[i], nodes[i + 1], nodes[i + 2] = (
+                makenode(f"{nodes[i][1]}{tmp1[0]}{nodes[i + 2][1]}</title>"),
+                ("", ""),
+                ("", ""),
             )
-    return [_ for _ in lines if _ != ""]
+    return [_ for _ in nodes if _[1] != ""]
 
 
-def post_acrostic(lines: list[str]) -> list[str]:
+def post_acrostic(nodes: list[tuple[str, str]]) -> list[tuple[str, str]]:
     """Fix verse end markers following "acrostic" Titles."""
     # This exists because I can't figure out why my other fixes aren't working.
-    for i, j in (
-        (x, y)
-        for x in ('<title type="acrostic"', "</lg", "</l>", "<!- ", "</p>")
-        for y in (_ for _ in range(len(lines)) if lines[_].startswith("<verse eID"))
-    ):
-        if lines[j - 1].startswith(i) and i != "</l>":
-            lines.insert(j - 1, lines.pop(j))
-        elif lines[j - 1].endswith(i) and i == "</l>":
-            lines[j - 1], lines[j] = (
-                f'{lines[j - 1].rpartition("<")[0]}{lines[j]}</l>',
-                "",
-            )
-    return [_ for _ in lines if _ != ""]
+    # positions of verse end tags are kept up to date the same way as in
+    # post_verseend.
+    ends = [_ for _ in range(len(nodes)) if nodes[_][0] == "<verse eID"]
+    for tag in ('<title type="acrostic"', "</lg", "</l>", "<!- ", "</p>"):
+        newends: list[int] = []
+        for i in ends:
+            if nodes[i - 1][1].startswith(tag) and tag != "</l>":
+                nodes[i - 1], nodes[i] = nodes[i], nodes[i - 1]
+                i -= 1
+            elif nodes[i - 1][1].endswith(tag) and tag == "</l>":
+                nodes[i - 1], nodes[i] = (
+                    makenode(f'{nodes[i - 1][1].rpartition("<")[0]}{nodes[i][1]}</l>'),
+                    ("", ""),
+                )
+                i -= 1
+                if nodes[i][0] != "<verse eID" or i in newends[-1:]:
+                    continue
+            newends.append(i)
+        ends = newends
+    return [_ for _ in nodes if _[1] != ""]
 
 
 # -------------------------------------------------------------------------- #
 
 
-def doconvert(text: str) -> tuple[str, ...]:
-    """Convert our text and return our results."""
+def c2o_bookstart(text: str) -> tuple[str, str, list[str]]:
+    """Get book id and description, and split text into lines for processing."""
     # convert cl lines to form that follows each chapter marker instead of
     # form that precedes first chapter.
     if r"\cl " in text:
         text = convertcl(text)
 
     # get book id. use TEST if none present.
-    lines = [_ for _ in text.splitlines() if _.startswith("\\id ")]
-    bookid = (
-        "TEST"
-        if not lines
-        else BOOKNAMES.get(
-            lines[0].split()[1].strip(), f"* {lines[0].split()[1].strip()}"
-        )
-    )
+    bookid = getbookid(text)
     if bookid.startswith("* "):
         LOG.error("Book id naming issue - %s", bookid.replace("* ", ""))
         sysexit()
@@ -2739,31 +2985,51 @@ def doconvert(text: str) -> tuple[str, ...]:
     descriptiontext, newtext = c2o_getdescription(text)
 
     LOG.info("... Processing %s ...", bookid)
-    # preprocess, split text, mark introduction endings... then process
-    # identification, character styles, special features, footnotes and cross references,
-    # ztags, paragraph style formatting
+    # preprocess, split text, mark introduction endings...
+    return (
+        bookid,
+        descriptiontext,
+        markintroend(c2o_preprocess(reflow(newtext)).splitlines()),
+    )
+
+
+def c2o_booklines(lines: list[str]) -> list[str]:
+    """
+    Process each line of a book.
+
+    Lines are processed independently of each other, so a book can be split
+    into parts that are processed separately.
+
+    """
+    # process identification, character styles, special features,
+    # footnotes and cross references, ztags, paragraph style formatting
+    return [
+        c2o_titlepar(
+            c2o_ztags(
+                c2o_noterefmarkers(
+                    c2o_specialfeatures(c2o_specialtext(c2o_identification(_)))
+                )
+            )
+        )
+        for _ in lines
+    ]
+
+
+def c2o_bookfinish(
+    bookid: str, descriptiontext: str, booklines: list[str]
+) -> tuple[str, ...]:
+    """Finish processing of the lines of a book and return our results."""
     # words of Jesus
     # fix groupings for poetry, lists, tables
     # process chapter/verse markers
-    lines = c2o_chapverse(
-        c2o_fixgroupings(
-            c2o_processwj2(
-                [
-                    c2o_titlepar(
-                        c2o_ztags(
-                            c2o_noterefmarkers(
-                                c2o_specialfeatures(
-                                    c2o_specialtext(c2o_identification(_))
-                                )
-                            )
-                        )
-                    )
-                    for _ in markintroend(c2o_preprocess(reflow(newtext)).splitlines())
-                ]
-            )
-        ),
-        bookid,
-    )
+    lines = c2o_chapverse(c2o_fixgroupings(c2o_processwj2(booklines)), bookid)
+    return c2o_bookpost(bookid, descriptiontext, lines)
+
+
+def c2o_bookpost(
+    bookid: str, descriptiontext: str, lines: list[str]
+) -> tuple[str, ...]:
+    """Postprocess the lines of a book and return our results."""
     # postprocessing to fix some issues that may be present
     linespost = post_acrostic(
         post_dverse(
@@ -2772,15 +3038,19 @@ def doconvert(text: str) -> tuple[str, ...]:
                     post_versestart(
                         post_verseend(
                             post_swap_lblg(
-                                post_tagadjust(
-                                    post_vp(
-                                        post_sidebar(
-                                            [
-                                                _.strip()
-                                                for _ in "\n".join(lines).splitlines()
-                                                if _.strip() != ""
-                                                and _.strip() != "<!-- b -->"
-                                            ]
+                                post_nodes(
+                                    post_tagadjust(
+                                        post_vp(
+                                            post_sidebar(
+                                                [
+                                                    _.strip()
+                                                    for _ in "\n".join(
+                                                        lines
+                                                    ).splitlines()
+                                                    if _.strip() != ""
+                                                    and _.strip() != "<!-- b -->"
+                                                ]
+                                            )
                                         )
                                     )
                                 )
@@ -2791,197 +3061,1385 @@ def doconvert(text: str) -> tuple[str, ...]:
             )
         )
     )
-    return bookid, descriptiontext, "\n".join([_ for _ in linespost if _ != ""])
+    return bookid, descriptiontext, "\n".join([_[1] for _ in linespost if _[1] != ""])
 
 
-def proc_readfiles(fnames: list[str], fencoding: str) -> str:
-    """Read files and return concatenated file contents."""
-    files = []
-    for fname in fnames:
-        # read our text files, stripping whitespace from beginning and end of text
-        with open(fname, "rb") as ifile:
-            text = ifile.read().strip()
+def doconvert(text: str) -> tuple[str, ...]:
+    """Convert our text and return our results."""
+    bookid, descriptiontext, lines = c2o_bookstart(text)
+    return c2o_bookfinish(bookid, descriptiontext, c2o_booklines(lines))
 
-        # get encoding. Abort processing if we don't know the encoding.
-        # default to utf_8_sig encoding if no encoding is specified.
-        bookencoding = "utf_8_sig"
-        try:
-            bookencoding = (
-                lookup(fencoding).name if fencoding is not None else getencoding(text)
-            )
-            if "utf-8" in bookencoding:
-                bookencoding = "utf_8_sig"
 
-            # use utf_8_sig in place of utf_8 encoding to eliminate errors that
-            # may occur if a Byte Order Mark is present in the input file.
-            if bookencoding == "utf_8":
-                bookencoding = "utf_8_sig"
-        except LookupError:
-            LOG.error("ERROR: Unknown encoding... aborting conversion.")
-            LOG.error(r"    \ide line for %s says --> %s", fname, bookencoding)
-            sysexit()
+def proc_bookencoding(fname: str, fencoding: str | None) -> str:
+    """
+    Get the encoding to use for a usfm file.
 
-        # convert file to unicode and add contents to list for processing...
-        files.append(text.decode(bookencoding))
-    return "\ufddf".join(files)
+    Unless an encoding is given, the \\ide line is looked for in the first
+    few KB of the file, since it normally follows the \\id line.
 
+    """
+    # get encoding. Abort processing if we don't know the encoding.
+    # default to utf_8_sig encoding if no encoding is specified.
+    bookencoding = "utf_8_sig"
+    try:
+        if fencoding is not None:
+            bookencoding = lookup(fencoding).name
+        else:
+            with open(fname, "rb") as ifile:
+                head = ifile.read(IDESNIFF)
+            # ignore the last line if it may have been cut off.
+            if len(head) == IDESNIFF:
+                head = head.rpartition(b"\n")[0]
+            bookencoding = getencoding(head)
+            lookup(bookencoding)
+        if "utf-8" in bookencoding:
+            bookencoding = "utf_8_sig"
+
+        # use utf_8_sig in place of utf_8 encoding to eliminate errors that
+        # may occur if a Byte Order Mark is present in the input file.
+        if bookencoding == "utf_8":
+            bookencoding = "utf_8_sig"
+    except LookupError:
+        LOG.error("ERROR: Unknown encoding... aborting conversion.")
+        LOG.error(r"    \ide line for %s says --> %s", fname, bookencoding)
+        sysexit()
+    return bookencoding
 
-def proc_xmlvalidate(osisdoc2: bytes) -> bytes:
-    """Validate and reformat osis and return results."""
-    # a test string allows output to still be generated
-    # even when when validation fails.
-    testosis = squeeze(osisdoc2.decode("utf_8"))
 
-    LOG.info("Validating osis xml...")
-    osisschema = decode(decode(decode(SCHEMA, "base64"), "bz2"), "utf_8")
-    xmlschema = decode(
-        decode(decode(XMLSCHEMA, "base64"), "bz2"),
-        "utf_8",
-    )
-    with NamedTemporaryFile(suffix=".xsd") as xmlxsd:
-        osisschema = osisschema.replace(
-            "http://www.w3.org/2001/03/xml.xsd",
-            f"file://{xmlxsd.name}",
-        )
-        xmlxsd.write(xmlschema.encode("utf_8"))
+def proc_readbook(fname: str, bookencoding: str) -> str:
+    """
+    Read a usfm file and return its text.
 
-        try:
-            vparser = et.XMLParser(
-                schema=et.XMLSchema(et.XML(osisschema)),
-                remove_blank_text=True,
-            )
-            _ = et.fromstring(testosis.encode("utf_8"), vparser)  # nosec
-            LOG.warning("Validation passed!")
-            osisdoc2 = et.tostring(
-                _,
-                pretty_print=True,
-                xml_declaration=True,
-                encoding="utf-8",  # lxml seems to need utf-8 instead of utf_8
-            )
-        except et.XMLSyntaxError as err:
-            LOG.error("Validation failed: %s", str(err))
-    return osisdoc2
+    The file is memory mapped and decoded without first reading it into a
+    separate buffer. Whitespace is stripped from beginning and end of text.
 
+    """
+    with open(fname, "rb") as ifile:
+        if fstat(ifile.fileno()).st_size == 0:
+            return ""
+        with (
+            mmap(ifile.fileno(), 0, access=ACCESS_READ) as mfile,
+            memoryview(mfile) as data,
+        ):
+            start, end = 0, len(data)
+            while start < end and data[start] in WSBYTES:
+                start += 1
+            while end > start and data[end - 1] in WSBYTES:
+                end -= 1
+            return decode(data[start:end], bookencoding)
 
-def processfiles(
-    fnames: list[str],
-    fencoding: str,
-    dodebug: bool,
-    sortorder: str,
-    langcode: str,
-    nonormalize: bool,
-    workid: str,
-    outputfile: str,
-) -> None:
-    """Process usfm files specified on command line."""
-    books: dict[str, str] = {}
-    descriptions: dict[str, str] = {}
-    booklist: list[str] = []
 
-    # get username from operating system
-    username = {True: getenv("LOGNAME"), False: getenv("USERNAME")}[
-        getenv("USERNAME") is None
-    ]
+def proc_booktext(book: str | tuple[str, str]) -> str:
+    """Get text of a book, which is either its text or its file and encoding."""
+    return book if isinstance(book, str) else proc_readbook(*book)
 
-    # read all files
-    LOG.info("Reading files... ")
 
-    # process file contents
-    filelist = proc_readfiles(fnames, fencoding).split("\ufddf")
-    results: list[tuple[str, ...]]
-    LOG.info("Processing files...")
-    with ProcessPoolExecutor() as executor:
-        results = (
-            list(executor.map(doconvert, filelist))
-            if not dodebug
-            else [doconvert(_) for _ in filelist]
-        )
+def proc_predictbookid(book: str | tuple[str, str]) -> str | None:
+    """
+    Get the book id a book will have once it is converted, if it is known.
 
-    # store results
-    for bookid, descriptiontext, newtext in results:
-        # store our converted text for output
-        if bookid != "TEST":
-            books[bookid] = (
-                (f'<div type="{NONCANONICAL[bookid]}">\n{newtext}\n</div>\n\n')
-                if bookid in NONCANONICAL
-                else (
-                    f'<div type="book" osisID="{bookid}" canonical="true">\n{newtext}\n</div>\n\n'
-                )
-            )
-            descriptions[bookid] = descriptiontext
-            booklist.append(bookid)
+    For books that are still in their file only the first few KB of the
+    file are looked at, so None is returned if no id line is found there.
+
+    """
+    try:
+        if isinstance(book, str):
+            bookid = getbookid(book)
         else:
-            books[bookid], descriptions[bookid] = (
-                (f"{books[bookid]}\n{newtext}", f"{books[bookid]}\n{descriptiontext}")
-                if bookid in books
-                else (newtext, descriptiontext)
-            )
-            if "TEST" not in booklist:
-                booklist.append("TEST")
+            with open(book[0], "rb") as ifile:
+                head = ifile.read(IDESNIFF)
+            if len(head) < IDESNIFF:
+                bookid = getbookid(proc_readbook(*book))
+            else:
+                # decode the start of the file the same way as proc_readbook,
+                # leaving out the last line since it may have been cut off.
+                start = 0
+                while start < len(head) and head[start] in WSBYTES:
+                    start += 1
+                bookid = getbookid(decode(head[start:].rpartition(b"\n")[0], book[1]))
+    except (UnicodeDecodeError, IndexError):
+        return None
+    return bookid if bookid != "TEST" else None
+
+
+def proc_booksize(book: str | tuple[str, str]) -> int:
+    """Get the size of a book, used as an estimate of its conversion time."""
+    return len(book) if isinstance(book, str) else getsize(book[0])
+
+
+def proc_bookconvert(
+    book: str | tuple[str, str],
+    profile: bool = False,
+    cachefile: tuple[str, str] | None = None,
+    finish: Callable[[tuple[str, ...]], tuple[Any, ...]] | None = None,
+) -> tuple[tuple[Any, ...], dict[str, Any] | None]:
+    """
+    Convert a book, reading it from its file if needed.
 
-    # ## Get order for books...
-    if sortorder in {"none", "canonical"}:
-        tmp, tmp2 = (
-            (
-                "\n".join([books[_] for _ in booklist])
-                if sortorder == "none"
-                else "\n".join([books[_] for _ in CANONICALORDER if _ in books])
-            ),
-            (
-                [descriptions[_] for _ in booklist]
-                if sortorder == "none"
-                else [descriptions[_] for _ in CANONICALORDER if _ in books]
-            ),
-        )
-    else:
-        with open(f"order-{sortorder}.txt", "r", encoding="utf_8") as order:
-            bookorderstr = order.read()
-            bookorder = [
-                _
-                for _ in bookorderstr.splitlines()
-                if _ != "" and not _.startswith("#")
-            ]
-        tmp, tmp2 = (
-            "\n".join([books[_] for _ in bookorder if _ in books]),
-            [descriptions[_] for _ in bookorder if _ in books],
-        )
+    Returns the converted book, or what finish returns for it, and its
+    profile, which is None unless profile is set.
 
-    # check for strongs presence in osis
-    strongsheader = STRONGSWORK if "<w " in tmp else ""
+    """
+    text = proc_booktext(book)
+    result, bookprofile = (
+        proc_profileconvert(text) if profile else (doconvert(text), None)
+    )
+    if cachefile is not None:
+        proc_cachestore(*cachefile, result)
+    return (result if finish is None else finish(result)), bookprofile
 
-    # assemble osis doc in desired order
-    osisdoc = "{}{}{}\n".format(
-        OSISHEADER.format(
-            workid,
-            langcode,
-            username,
-            datetime.now().strftime("%Y.%m.%dT%H.%M.%S"),
-            workid,
+
+def proc_cachekey(book: str | tuple[str, str]) -> str:
+    """
+    Get the build cache key for a book.
+
+    For books that are still in their file, the key is made from the
+    encoding and contents of the file without decoding it.
+
+    """
+    from hashlib import sha256
+
+    version = META["VERSION"]
+    if isinstance(book, str):
+        return sha256(f"{version}\ufddf{book}".encode("utf_8")).hexdigest()
+    key = sha256(f"{version}\ufddf{book[1]}\ufddf".encode("utf_8"))
+    with open(book[0], "rb") as ifile:
+        if fstat(ifile.fileno()).st_size > 0:
+            with mmap(ifile.fileno(), 0, access=ACCESS_READ) as mfile:
+                key.update(mfile)
+    return key.hexdigest()
+
+
+def proc_cacheload(cachedir: str, key: str) -> tuple[str, ...] | None:
+    """Load converted book from build cache if present."""
+    with suppress(OSError, ValueError):
+        with open(pathjoin(cachedir, f"{key}.json"), "r", encoding="utf_8") as cfile:
+            result = tuple(jsonload(cfile))
+        if len(result) == 3:
+            return result
+    return None
+
+
+def proc_cachestore(cachedir: str, key: str, result: tuple[str, ...]) -> None:
+    """
+    Store converted book in build cache.
+
+    The cache only saves time, so if the book can't be stored the conversion
+    carries on without caching it.
+
+    """
+    tmpname = None
+    try:
+        with NamedTemporaryFile(
+            "w", encoding="utf_8", dir=cachedir, suffix=".tmp", delete=False
+        ) as cfile:
+            tmpname = cfile.name
+            jsondump(result, cfile)
+        replace(tmpname, pathjoin(cachedir, f"{key}.json"))
+    except OSError as err:
+        LOG.warning("Note:  unable to store %s in cache - %s", result[0], err)
+        if tmpname is not None:
+            with suppress(OSError):
+                remove(tmpname)
+
+
+def proc_chunklines(lines: list[str], chunksize: int) -> list[list[str]]:
+    """Split lines of a book at chapter boundaries into chunks of about chunksize."""
+    chunks: list[list[str]] = [[]]
+    size = 0
+    for line in lines:
+        if size >= chunksize and line.startswith("\\c "):
+            chunks.append([])
+            size = 0
+        chunks[-1].append(line)
+        size += len(line)
+    return chunks
+
+
+def proc_bookstart(
+    book: str | tuple[str, str], chunksize: int
+) -> tuple[str, str, list[list[str]]]:
+    """Start converting a book and split its lines into chunks of about chunksize."""
+    bookid, descriptiontext, lines = c2o_bookstart(proc_booktext(book))
+    return bookid, descriptiontext, proc_chunklines(lines, chunksize)
+
+
+def proc_chunkconvert(
+    bookid: str, lines: list[str], last: bool
+) -> tuple[list[str], bool, bool | None, bool]:
+    """
+    Process a chunk of a book up to and including chapter and verse tags.
+
+    The flags returned with the lines are checked by proc_chunkseams.
+
+    """
+    booklines = c2o_booklines(lines)
+    grouplines = c2o_fixgroupings(c2o_processwj2(booklines))
+    if not last:
+        # the empty line that closes open groups belongs at the end of the book.
+        grouplines.pop()
+    chapterlines = c2o_chapverse(grouplines, bookid)
+
+    # c2o_processwj2 marks words of Jesus up to the next \wj* or line break.
+    wjopen = None
+    for num in range(len(booklines) - 1, -1, -1):
+        if "\\wj " in booklines[num]:
+            tail = "\ufdd1".join(booklines[num:])
+            tail = tail[tail.rfind("\\wj ") :]
+            wjopen = "\\wj*" not in tail and "".join(tail.splitlines()) == tail
+            break
+        line = booklines[num]
+        if "\\wj*" in line or "".join(line.splitlines()) != line:
+            wjopen = False
+            break
+
+    # c2o_chapverse splits the lines at \ufdd0 and only sees chapter tags at
+    # the start of a part, so nothing but spaces may follow the last one.
+    endok = False
+    for line in reversed(grouplines):
+        if "\ufdd0" in line:
+            endok = line.rpartition("\ufdd0")[2].strip() == ""
+            break
+        if line.strip() != "":
+            break
+    # end tags for verses before the first chapter aren't added when the
+    # book is processed in one piece.
+    if chapterlines and chapterlines[-1].startswith(
+        (f'<chapter eID="{bookid}." ', f'<verse eID="{bookid}..')
+    ):
+        endok = False
+
+    return (
+        chapterlines,
+        bool(grouplines) and grouplines[0].lstrip().startswith("\\c "),
+        wjopen,
+        endok,
+    )
+
+
+def proc_chunkseams(chunks: list[tuple[list[str], bool, bool | None, bool]]) -> bool:
+    """Check that chunks from proc_chunkconvert give the same result as one piece."""
+    wjopen = False
+    for num, (_, startok, chunkwj, endok) in enumerate(chunks):
+        if num > 0 and (wjopen or not startok):
+            return False
+        wjopen = wjopen if chunkwj is None else chunkwj
+        if num < len(chunks) - 1 and not endok:
+            return False
+    return True
+
+
+def proc_bookjoin(
+    bookid: str,
+    descriptiontext: str,
+    chunks: list[list[str]],
+    cachefile: tuple[str, str] | None = None,
+    finish: Callable[[tuple[str, ...]], tuple[Any, ...]] | None = None,
+) -> tuple[tuple[Any, ...], None]:
+    """
+    Join chunks of a book that were processed separately and finish it.
+
+    cachefile and finish are used the same way as by proc_bookconvert.
+
+    """
+    result = c2o_bookpost(bookid, descriptiontext, [_ for __ in chunks for _ in __])
+    if cachefile is not None:
+        proc_cachestore(*cachefile, result)
+    return (result if finish is None else finish(result)), None
+
+
+def proc_submitchunks(
+    executor: Executor,
+    book: str | tuple[str, str],
+    chunksize: int,
+    cachefile: tuple[str, str] | None = None,
+    finish: Callable[[tuple[str, ...]], tuple[Any, ...]] | None = None,
+) -> Future:
+    """
+    Convert a book in chunks that are processed in parallel.
+
+    Returns a future with the same result as proc_bookconvert.
+
+    """
+    bookfuture: Future = Future()
+    lock = Lock()
+
+    def step(func: Callable[..., None]) -> Callable[[Future], None]:
+        """Run the next step when a step is done, passing on any exception."""
+
+        def callback(future: Future) -> None:
+            try:
+                if not bookfuture.done():
+                    func(future.result())
+            except BaseException as err:  # pylint: disable=broad-exception-caught
+                with lock:
+                    if not bookfuture.done():
+                        bookfuture.set_exception(err)
+
+        return callback
+
+    def started(start: tuple[str, str, list[list[str]]]) -> None:
+        """Submit the chunks of a book once it has been split."""
+        bookid, descriptiontext, chunks = start
+        LOG.info("... Split %s into %s parts ...", bookid, len(chunks))
+        futures: list[Future] = []
+        waiting = [len(chunks)]
+
+        def chunkdone(_: tuple[Any, ...]) -> None:
+            with lock:
+                waiting[0] -= 1
+                if waiting[0] > 0:
+                    return
+            results = [_.result() for _ in futures]
+            if not proc_chunkseams(results):
+                # rare, so the book is simply converted again in one piece.
+                LOG.info("... Converting %s in one part ...", bookid)
+                executor.submit(
+                    proc_bookconvert, book, False, cachefile, finish
+                ).add_done_callback(step(bookfuture.set_result))
+                return
+            executor.submit(
+                proc_bookjoin,
+                bookid,
+                descriptiontext,
+                [_[0] for _ in results],
+                cachefile,
+                finish,
+            ).add_done_callback(step(bookfuture.set_result))
+
+        # callbacks are only added once all chunks are submitted, since a
+        # chunk may be done before the next one is submitted.
+        futures.extend(
+            executor.submit(proc_chunkconvert, bookid, _, num == len(chunks) - 1)
+            for num, _ in enumerate(chunks)
+        )
+        for future in futures:
+            future.add_done_callback(step(chunkdone))
+
+    executor.submit(proc_bookstart, book, chunksize).add_done_callback(step(started))
+    return bookfuture
+
+
+def proc_profilewrap(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a stage so its time, number of calls and peak memory are recorded."""
+    import tracemalloc
+
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        # tracemalloc only keeps one peak, so the peak of the running stage
+        # is saved before it is reset and passed back up when we finish.
+        current, peak = tracemalloc.get_traced_memory()
+        if PROFILESTACK:
+            PROFILESTACK[-1][1] = max(PROFILESTACK[-1][1], peak)
+        tracemalloc.reset_peak()
+        frame = [current, current]
+        PROFILESTACK.append(frame)
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            PROFILESTACK.pop()
+            peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+            if PROFILESTACK:
+                PROFILESTACK[-1][1] = max(PROFILESTACK[-1][1], peak)
+            stats = PROFILESTATS.setdefault(name, [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], peak - frame[0])
+            if name not in PROFILELINESTAGES:
+                PROFILEEVENTS.append((name, start, elapsed))
+
+    return wrapper
+
+
+def proc_profilestart() -> dict[str, Callable[..., Any]]:
+    """
+    Start profiling the c2o_* and post_* stages and reflow in this process.
+
+    Returns the functions that were replaced by profiling wrappers, which
+    are put back by proc_profilestop.
+
+    """
+    import tracemalloc
+    from inspect import isfunction, isgeneratorfunction
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    module = globals()
+    originals: dict[str, Callable[..., Any]] = {}
+    for name, func in list(module.items()):
+        if (
+            (name.startswith(("c2o_", "post_")) or name == "reflow")
+            and isfunction(func)
+            and not isgeneratorfunction(func)
+            and not hasattr(func, "__wrapped__")
+        ):
+            originals[name] = func
+            module[name] = proc_profilewrap(name, func)
+    return originals
+
+
+def proc_profilestop(originals: dict[str, Callable[..., Any]], tracing: bool) -> None:
+    """
+    Stop profiling, putting back the functions replaced by proc_profilestart.
+
+    tracemalloc is left running if it was already tracing when profiling
+    started.
+
+    """
+    import tracemalloc
+
+    globals().update(originals)
+    if not tracing:
+        tracemalloc.stop()
+
+
+def proc_profileconvert(text: str) -> tuple[tuple[str, ...], dict[str, Any]]:
+    """
+    Convert a book with profiling enabled, returning results and profile.
+
+    Profiling is stopped again once the book is converted, so it doesn't
+    slow down later conversions done by this process.
+
+    """
+    import tracemalloc
+
+    tracing = tracemalloc.is_tracing()
+    originals = proc_profilestart()
+    PROFILESTATS.clear()
+    PROFILEEVENTS.clear()
+    try:
+        result = proc_profilewrap("doconvert", doconvert)(text)
+    finally:
+        proc_profilestop(originals, tracing)
+    _, seconds, peak = PROFILESTATS["doconvert"]
+    return result, {
+        "book": result[0],
+        "pid": getpid(),
+        "seconds": seconds,
+        "peak": peak,
+        "stages": {
+            _[0]: {"calls": _[1][0], "seconds": _[1][1], "peak": _[1][2]}
+            for _ in PROFILESTATS.items()
+            if _[0] != "doconvert"
+        },
+        "events": PROFILEEVENTS.copy(),
+    }
+
+
+def proc_profilereport(
+    profile: list[dict[str, Any]], outputfile: str, profileformat: str
+) -> None:
+    """
+    Write profile of converted books as a table, json, or chrome trace.
+
+    The table is written to stderr when outputfile is empty. Stage times
+    include the time spent in any stages they call.
+
+    """
+    stages: dict[str, dict[str, float]] = {}
+    for book in profile:
+        for name, stats in book["stages"].items():
+            total = stages.setdefault(name, {"calls": 0, "seconds": 0.0, "peak": 0})
+            total["calls"] += stats["calls"]
+            total["seconds"] += stats["seconds"]
+            total["peak"] = max(total["peak"], stats["peak"])
+
+    if profileformat == "json":
+        text = jsondumps(
+            {
+                "books": [
+                    {_: book[_] for _ in book if _ != "events"} for book in profile
+                ],
+                "stages": stages,
+            },
+            indent=2,
+        )
+    elif profileformat == "chrome":
+        # times are given in microseconds from the start of the first book.
+        origin = min((_["events"][-1][1] for _ in profile), default=0.0)
+        text = jsondumps(
+            {
+                "traceEvents": [
+                    {
+                        "name": name,
+                        "cat": "u2o",
+                        "ph": "X",
+                        "ts": round((start - origin) * 1e6, 1),
+                        "dur": round(elapsed * 1e6, 1),
+                        "pid": book["pid"],
+                        "tid": book["pid"],
+                        "args": {"book": book["book"]},
+                    }
+                    for book in profile
+                    for name, start, elapsed in book["events"]
+                ],
+                "displayTimeUnit": "ms",
+            }
+        )
+    else:
+        lines = [
+            f"{'stage':<24}{'calls':>10}{'time':>11}{'peak KiB':>12}",
+            *(
+                f"{_[0]:<24}{_[1]['calls']:>10}{_[1]['seconds']:>10.3f}s"
+                f"{_[1]['peak'] / 1024:>12.1f}"
+                for _ in sorted(stages.items(), key=lambda x: -x[1]["seconds"])
+            ),
+            "",
+            f"{'book':<24}{'pid':>10}{'time':>11}{'peak KiB':>12}",
+            *(
+                f"{_['book']:<24}{_['pid']:>10}{_['seconds']:>10.3f}s"
+                f"{_['peak'] / 1024:>12.1f}"
+                for _ in sorted(profile, key=lambda x: -x["seconds"])
+            ),
+        ]
+        text = "\n".join(lines)
+
+    if outputfile == "":
+        print(text, file=stderr)
+    else:
+        with open(outputfile, "w", encoding="utf_8") as pfile:
+            pfile.write(f"{text}\n")
+
+
+def proc_cpuquota() -> float | None:
+    """
+    Get the number of cpus allowed by the cgroup cpu quota, if there is one.
+
+    Both cgroup v2 and v1 are checked, first for the cgroup of this process
+    and then for the root cgroup, which is what is seen in most containers.
+
+    """
+    groups = [""]
+    with suppress(OSError):
+        with open("/proc/self/cgroup", "r", encoding="utf_8") as ifile:
+            groups.extend(
+                _.split(":", 2)[2].rstrip("/")
+                for _ in ifile.read().splitlines()
+                if _.count(":") >= 2
+                and (_.startswith("0::") or "cpu" in _.split(":")[1].split(","))
+            )
+    for quotafile, periodfile in CGROUPQUOTA:
+        for group in reversed(groups):
+            with suppress(OSError, ValueError, IndexError):
+                with open(quotafile.format(group), "r", encoding="utf_8") as ifile:
+                    quota = ifile.read().split()
+                if periodfile:
+                    with open(periodfile.format(group), "r", encoding="utf_8") as ifile:
+                        quota.append(ifile.read().strip())
+                if quota[0] in {"max", "-1"}:
+                    return None
+                return int(quota[0]) / int(quota[1])
+    return None
+
+
+def proc_workercount() -> int:
+    """
+    Get the number of worker processes to use by default.
+
+    cpu_count gives the number of cpus on the host, even in a container or
+    when this process is limited to some of them. The cpu affinity of this
+    process and any cgroup cpu quota are used to lower the count.
+
+    """
+    try:
+        # sched_getaffinity gives the cpus this process may run on. It isn't
+        # available on all platforms.
+        from os import sched_getaffinity
+
+        count = len(sched_getaffinity(0))
+    except ImportError:
+        count = cpu_count() or 1
+    quota = proc_cpuquota()
+    if quota is not None:
+        count = min(count, ceil(quota))
+    return max(count, 1)
+
+
+def proc_startup(logqueue: Any = None) -> None:
+    """
+    Prepare this process for converting books.
+
+    This sets up logging and disables the garbage collector, which isn't
+    needed for this converter. It's done by the scripts and by the workers
+    of the process pool instead of when u2o is imported. When logqueue is
+    given, log records are put on it instead of being written to stderr.
+
+    """
+    # logging.basicConfig(format="%(levelname)s: %(message)s")
+    basicConfig(format="%(message)s")
+    if logqueue is not None:
+        from logging.handlers import QueueHandler
+
+        # forked workers get the handlers of the parent, which aren't wanted.
+        for handler in LOG.handlers[:]:
+            LOG.removeHandler(handler)
+        LOG.addHandler(QueueHandler(logqueue))
+        LOG.propagate = False
+    gcdisable()
+
+
+def proc_executor(
+    workers: int | None = None, startmethod: str | None = None, logqueue: Any = None
+) -> Executor:
+    """
+    Create a process pool for conversion.
+
+    The pool has workers processes, or one per cpu available to this
+    process when workers is None. startmethod sets how worker processes
+    are started (fork, forkserver or spawn). When it is None the default
+    for the platform is used. logqueue is passed to proc_startup in the
+    workers.
+
+    """
+    # modules that are only needed by some conversions are imported when
+    # they are used, which keeps startup fast.
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    return ProcessPoolExecutor(
+        max_workers=workers if workers is not None else proc_workercount(),
+        mp_context=get_context(startmethod) if startmethod is not None else None,
+        initializer=proc_startup,
+        initargs=(logqueue,),
+    )
+
+
+def proc_convert(
+    books: Iterable[str | tuple[str, str]],
+    executor: Executor | None,
+    cachedir: str | None = None,
+    chunksize: int | None = None,
+    profile: list[dict[str, Any]] | None = None,
+    finish: Callable[[tuple[str, ...]], tuple[Any, ...]] | None = None,
+    workers: int | None = None,
+) -> Iterator[tuple[Any, ...]]:
+    """
+    Convert books, yielding results in the same order as books.
+
+    A list of books is submitted to executor at once, largest first, and
+    other iterables a couple of books per worker at a time. finish is run
+    on each converted book by the worker that converted it.
+
+    """
+    pending: deque[Future | tuple[Any, ...]] = deque()
+    maxpending = 2 * (workers if workers is not None else proc_workercount())
+    bookcount = cachecount = 0
+    if cachedir is not None:
+        try:
+            makedirs(cachedir, exist_ok=True)
+        except OSError as err:
+            LOG.warning("Note:  unable to use cache - %s", err)
+            cachedir = None
+
+    def getresult(entry: Future | tuple[Any, ...]) -> tuple[Any, ...]:
+        """Get result of a conversion, keeping its profile."""
+        if isinstance(entry, Future):
+            entry = entry.result()
+        if profile is not None and entry[1] is not None:
+            profile.append(entry[1])
+        return entry[0]
+
+    def submit(book: str | tuple[str, str]) -> Future | tuple[Any, ...]:
+        """Start converting a book, or load it from the cache."""
+        nonlocal cachecount
+        key, result = None, None
+        if cachedir is not None:
+            key = proc_cachekey(book)
+            result = proc_cacheload(cachedir, key)
+        cachefile = (
+            (cachedir, key) if cachedir is not None and key is not None else None
+        )
+        if result is not None:
+            cachecount += 1
+            return result if finish is None else finish(result), None
+        if executor is None:
+            return proc_bookconvert(book, profile is not None, cachefile, finish)
+        if (
+            chunksize is not None
+            and profile is None
+            and proc_booksize(book) > chunksize
+        ):
+            return proc_submitchunks(executor, book, chunksize, cachefile, finish)
+        return executor.submit(
+            proc_bookconvert, book, profile is not None, cachefile, finish
+        )
+
+    if executor is not None and isinstance(books, list):
+        # all books are known, so start with the largest ones. Otherwise a
+        # large book near the end is left running on its own while the
+        # rest of the pool sits idle.
+        bookcount = len(books)
+        entries = {
+            _: submit(books[_])
+            for _ in sorted(
+                range(bookcount), key=lambda _: proc_booksize(books[_]), reverse=True
+            )
+        }
+        for _ in range(bookcount):
+            yield getresult(entries.pop(_))
+    else:
+        for book in books:
+            bookcount += 1
+            pending.append(submit(book))
+            while pending and (
+                len(pending) > maxpending or isinstance(pending[0], tuple)
+            ):
+                yield getresult(pending.popleft())
+        while pending:
+            yield getresult(pending.popleft())
+    if cachedir is not None:
+        LOG.info("... %s of %s books found in cache ...", cachecount, bookcount)
+
+
+def proc_schemafile() -> str:
+    """
+    Get the location of the osis schema.
+
+    The schemas are decompressed into the user cache directory the first
+    time they are needed so later runs can skip that step. If the cache
+    directory can't be written, a temporary directory is used instead.
+
+    """
+    cachedir = pathjoin(
+        getenv("XDG_CACHE_HOME") or getenv("LOCALAPPDATA") or expanduser("~/.cache"),
+        "u2o",
+        f"schema-{META['VERSION']}",
+    )
+    osisxsd = pathjoin(cachedir, f"osisCore.{META['OSIS']}.xsd")
+    if isfile(osisxsd):
+        return osisxsd
+
+    osisschema = decode(decode(decode(SCHEMA, "base64"), "bz2"), "utf_8")
+    xmlschema = decode(
+        decode(decode(XMLSCHEMA, "base64"), "bz2"),
+        "utf_8",
+    )
+    # xml.xsd is imported relative to the location of the osis schema.
+    osisschema = osisschema.replace("http://www.w3.org/2001/03/xml.xsd", "xml.xsd")
+
+    def writeschemas(xsddir: str) -> str:
+        """Write the schemas to xsddir and return location of the osis schema."""
+        makedirs(xsddir, exist_ok=True)
+        # xml.xsd is written first since the osis schema marks the cache as
+        # complete.
+        for fname, text in (("xml.xsd", xmlschema), (basename(osisxsd), osisschema)):
+            with NamedTemporaryFile(
+                "w", encoding="utf_8", dir=xsddir, suffix=".tmp", delete=False
+            ) as xsdfile:
+                xsdfile.write(text)
+            replace(xsdfile.name, pathjoin(xsddir, fname))
+        return pathjoin(xsddir, basename(osisxsd))
+
+    try:
+        return writeschemas(cachedir)
+    except OSError:
+        return writeschemas(mkdtemp(prefix="u2o-"))
+
+
+@cache
+def proc_startmethods() -> tuple[str, ...]:
+    """Get the start methods that can be used for the process pool."""
+    from multiprocessing import get_all_start_methods
+
+    return tuple(get_all_start_methods())
+
+
+def proc_poolargs(
+    parser: ArgumentParser, serial: bool = True, profile: bool = True
+) -> None:
+    """
+    Add the options for the process pool to a command line parser.
+
+    --serial and the --profile options are left out when serial or
+    profile is False.
+
+    """
+    parser.add_argument(
+        "--chunk-size",
+        help="split books larger than this at chapter boundaries and process "
+        "the parts in parallel",
+        type=int,
+        metavar="CHARS",
+    )
+    parser.add_argument(
+        "--workers",
+        help="number of worker processes, one per available cpu when not given",
+        type=int,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--start-method",
+        help="how worker processes are started, platform default when not given",
+        choices=proc_startmethods(),
+    )
+    if serial:
+        parser.add_argument(
+            "--serial",
+            help="convert books one at a time without using worker processes",
+            action="store_true",
+        )
+    if profile:
+        parser.add_argument(
+            "--profile",
+            help="profile time and memory used by each stage of conversion",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--profile-output",
+            help="write profile to file instead of stderr",
+            default="",
+            metavar="FILE",
+        )
+        parser.add_argument(
+            "--profile-format",
+            help="format of profile",
+            choices=("table", "json", "chrome"),
+            default="table",
+        )
+
+
+@cache
+def proc_xmlschema() -> Any:
+    """
+    Build the osis schema used for validation.
+
+    The compiled schema is reused for every document validated by this
+    process.
+
+    """
+    import lxml.etree as et  # nosec
+
+    return et.XMLSchema(file=proc_schemafile())
+
+
+def proc_xmlvalidate(osisdoc2: bytes) -> bytes:
+    """Validate and reformat osis and return results."""
+    import lxml.etree as et  # nosec
+
+    # a test string allows output to still be generated
+    # even when when validation fails.
+    testosis = squeeze(osisdoc2.decode("utf_8"))
+
+    LOG.info("Validating osis xml...")
+    try:
+        vparser = et.XMLParser(
+            schema=proc_xmlschema(),
+            remove_blank_text=True,
+        )
+        _ = et.fromstring(testosis.encode("utf_8"), vparser)  # nosec
+        LOG.warning("Validation passed!")
+        osisdoc2 = et.tostring(
+            _,
+            pretty_print=True,
+            xml_declaration=True,
+            encoding="utf-8",  # lxml seems to need utf-8 instead of utf_8
+        )
+    except et.XMLSyntaxError as err:
+        # the squeezed text is all on one line, so the errors are looked up
+        # again in the document that is written instead.
+        for _ in proc_xmlerrors(BytesIO(osisdoc2)) or [str(err)]:
+            LOG.error("Validation failed: %s", _)
+    return osisdoc2
+
+
+def proc_xmlerrors(source: str | BinaryIO) -> list[str]:
+    """Get validation errors for an osis file, with the line they are on."""
+    import lxml.etree as et  # nosec
+
+    try:
+        doc = et.parse(source)  # nosec
+    except et.XMLSyntaxError as err:
+        return [f"line {_.line}: {_.message}" for _ in err.error_log]
+    schema = proc_xmlschema()
+    if schema.validate(doc):
+        return []
+    return [f"line {_.line}: {_.message}" for _ in schema.error_log]
+
+
+def proc_xmlvalidatefile(fname: str) -> None:
+    """
+    Validate an osis file without loading the whole document.
+
+    Elements are discarded as soon as they have been validated so memory
+    use stays small no matter how large the file is.
+
+    """
+    import lxml.etree as et  # nosec
+
+    LOG.info("Validating osis xml...")
+    try:
+        for _, elem in et.iterparse(
+            fname, events=("end",), schema=proc_xmlschema(), remove_blank_text=True
+        ):  # nosec
+            elem.clear(keep_tail=True)
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        LOG.warning("Validation passed!")
+    except et.XMLSyntaxError as err:
+        # schema errors found while parsing don't have line numbers.
+        for _ in proc_xmlerrors(fname) or [str(err)]:
+            LOG.error("Validation failed: %s", _)
+
+
+def proc_xmlvalidatebook(
+    bookid: str, booktext: str, nonormalize: bool = True
+) -> list[str]:
+    """
+    Validate a single book wrapped in a minimal osis document.
+
+    Returns a list of errors with line numbers relative to the book text.
+
+    """
+    import lxml.etree as et  # nosec
+
+    if not nonormalize:
+        booktext = proc_normalize(booktext)
+    try:
+        doc = et.fromstring(
+            f"{OSISENVELOPE[0]}\n{booktext}{OSISENVELOPE[1]}".encode("utf_8")
+        )  # nosec
+    except et.XMLSyntaxError as err:
+        return [f"{bookid} line {_.line - 1}: {_.message}" for _ in err.error_log]
+    schema = proc_xmlschema()
+    if schema.validate(doc):
+        return []
+    return [f"{bookid} line {_.line - 1}: {_.message}" for _ in schema.error_log]
+
+
+def proc_xmlvalidatebooks(bookerrors: Iterable[list[str]], header: str) -> None:
+    """
+    Report results of validating books separately.
+
+    The osis header and footer are checked on their own once all of the
+    books have been validated.
+
+    """
+    import lxml.etree as et  # nosec
+
+    errors = [_ for __ in bookerrors for _ in __]
+    try:
+        schema = proc_xmlschema()
+        if not schema.validate(
+            et.fromstring(f"{header}{OSISFOOTER}".encode("utf_8"))  # nosec
+        ):
+            errors.extend(f"osis envelope: {_.message}" for _ in schema.error_log)
+    except et.XMLSyntaxError as err:
+        errors.append(f"osis envelope: {err}")
+    for _ in errors:
+        LOG.error("Validation failed: %s", _)
+    if not errors:
+        LOG.warning("Validation passed!")
+
+
+def proc_bookdiv(bookid: str, newtext: str) -> str:
+    """Wrap converted book text in an osis div."""
+    return (
+        (f'<div type="{NONCANONICAL[bookid]}">\n{newtext}\n</div>\n\n')
+        if bookid in NONCANONICAL
+        else (
+            f'<div type="book" osisID="{bookid}" canonical="true">\n{newtext}\n</div>\n\n'
+        )
+    )
+
+
+def proc_storeresults(
+    results: Iterable[tuple[str, ...]],
+) -> tuple[dict[str, str], dict[str, str], list[str]]:
+    """Store converted books and descriptions for output."""
+    books: dict[str, str] = {}
+    descriptions: dict[str, str] = {}
+    booklist: list[str] = []
+    for bookid, descriptiontext, newtext in results:
+        # store our converted text for output
+        if bookid != "TEST":
+            books[bookid] = proc_bookdiv(bookid, newtext)
+            descriptions[bookid] = descriptiontext
+            booklist.append(bookid)
+        else:
+            books[bookid], descriptions[bookid] = (
+                (
+                    f"{books[bookid]}\n{newtext}",
+                    f"{descriptions[bookid]}\n{descriptiontext}",
+                )
+                if bookid in books
+                else (newtext, descriptiontext)
+            )
+            if "TEST" not in booklist:
+                booklist.append("TEST")
+    return books, descriptions, booklist
+
+
+@cache
+def proc_bookorders() -> tuple[str, ...]:
+    """
+    Get list of book orders available.
+
+    Book orders other than canonical and none come from external files in the
+    current working directory. Each order file has the following naming
+    pattern:
+        order-SOMEORDER.txt
+
+    """
+    return tuple(
+        chain(
+            ["canonical"],
+            sorted(
+                [
+                    _.replace("order-", "").replace(".txt", "")
+                    for _ in glob("order-*.txt")
+                ]
+            ),
+            ["none"],
+        )
+    )
+
+
+def proc_bookorder(
+    sortorder: str, booklist: list[str], books: Container[str]
+) -> list[str]:
+    """Get order for books."""
+    if sortorder == "none":
+        return booklist
+    if sortorder == "canonical":
+        return [_ for _ in CANONICALORDER if _ in books]
+    with open(f"order-{sortorder}.txt", "r", encoding="utf_8") as order:
+        bookorderstr = order.read()
+        bookorder = [
+            _ for _ in bookorderstr.splitlines() if _ != "" and not _.startswith("#")
+        ]
+    return [_ for _ in bookorder if _ in books]
+
+
+def proc_osisheader(
+    workid: str, langcode: str, descriptions: list[str], strongs: bool
+) -> str:
+    """Generate osis header."""
+    # get username from operating system
+    username = {True: getenv("LOGNAME"), False: getenv("USERNAME")}[
+        getenv("USERNAME") is None
+    ]
+
+    return OSISHEADER.format(
+        workid,
+        langcode,
+        username,
+        datetime.now().strftime("%Y.%m.%dT%H.%M.%S"),
+        workid,
+        workid,
+        "\n".join(descriptions),
+        langcode,
+        workid,
+        STRONGSWORK if strongs else "",
+    )
+
+
+def proc_cleanup(text: str) -> str:
+    """Simple whitespace cleanups before writing to file."""
+    with StringIO() as newdoc:
+        newdoc.write(
+            text.replace(" <note", "<note")
+            .replace(" </p>", "</p>")
+            .replace(" </item>", "</item>")
+            .replace(" </l>", "</l>")
+            .replace("</w><w", "</w> <w")
+            .replace(" </w>", "</w>")
+            .replace("</w><transChange", "</w> <transChange")
+            .replace("</transChange><w", "</transChange> <w")
+        )
+        return newdoc.getvalue()
+
+
+def proc_normalize(text: str) -> str:
+    """
+    Apply NFC normalization to text.
+
+    Most text is already normalized, so is_normalized is used to skip the
+    normalization, and the copy of the text it makes, when it isn't needed.
+
+    """
+    return text if is_normalized("NFC", text) else normalize("NFC", text)
+
+
+def proc_normalizebook(result: tuple[str, ...]) -> tuple[str, ...]:
+    """
+    Apply NFC normalization to a converted book.
+
+    TEST books are left alone since they are also printed as is. Books are
+    separated from each other and from the osis header by markup, so
+    normalizing them one at a time gives the same result as normalizing
+    the osis document as a whole.
+
+    """
+    bookid, descriptiontext, newtext = result
+    return (
+        result
+        if bookid == "TEST"
+        else (bookid, descriptiontext, proc_normalize(newtext))
+    )
+
+
+def proc_spoolbook(
+    spooldir: str, nonormalize: bool, validatebooks: bool, result: tuple[str, ...]
+) -> tuple[Any, ...]:
+    """
+    Prepare a converted book for output and write it to a file in spooldir.
+
+    Returns the book id, description, name of the spool file, whether the
+    book uses strongs numbers, unhandled usfm tags found in the book,
+    errors found when validating the book if validatebooks is set, and for
+    TEST books the text to print.
+
+    """
+    bookid, descriptiontext, newtext = result
+    booktext = newtext if bookid == "TEST" else proc_bookdiv(bookid, newtext)
+    booktext = proc_cleanup(booktext if nonormalize else proc_normalize(booktext))
+    with NamedTemporaryFile(
+        "w", encoding="utf_8", dir=spooldir, suffix=".osis", delete=False
+    ) as sfile:
+        sfile.write(booktext)
+    return (
+        bookid,
+        descriptiontext,
+        sfile.name,
+        "<w " in newtext,
+        set(getre(USFMPATTERN).findall(booktext)),
+        proc_xmlvalidatebook(bookid, booktext) if validatebooks else [],
+        newtext if bookid == "TEST" else None,
+    )
+
+
+def proc_copyfile(ofile: BinaryIO, ifile: BinaryIO) -> None:
+    """
+    Copy the contents of ifile to the end of ofile.
+
+    The data is copied by the kernel using copy_file_range where it is
+    available, falling back to copying through python when it isn't.
+
+    """
+    ofile.flush()
+    ifile.flush()
+    size = fstat(ifile.fileno()).st_size
+    copied = 0
+    # copy_file_range is only available on linux.
+    with suppress(ImportError, OSError):
+        from os import copy_file_range
+
+        while copied < size:
+            count = copy_file_range(
+                ifile.fileno(), ofile.fileno(), size - copied, copied
+            )
+            if count == 0:
+                break
+            copied += count
+    if copied < size:
+        ifile.seek(copied)
+        copyfileobj(ifile, ofile, 1048576)
+
+
+def proc_copyspool(ofile: BinaryIO, fname: str) -> None:
+    """Copy a spool file to the end of ofile."""
+    with open(fname, "rb") as sfile:
+        proc_copyfile(ofile, sfile)
+
+
+def proc_writestream(
+    ofile: BinaryIO,
+    results: Iterable[tuple[Any, ...]],
+    sortorder: str,
+    langcode: str,
+    nonormalize: bool,
+    workid: str,
+    validatebooks: bool = False,
+    bookids: list[str] | None = None,
+) -> None:
+    """
+    Write osis to a file handle one book at a time.
+
+    results come from proc_spoolbook. The header needs every book, so books
+    known to be next in the output (from bookids, or because books aren't
+    sorted) are copied to a temporary file that follows the header.
+
+    """
+    bookerrors: list[list[str]] = []
+    spool: dict[str, list[str]] = {}
+    descriptions: dict[str, str] = {}
+    strongs: set[str] = set()
+    booklist: list[str] = []
+    usfmtagset: set[str] = set()
+    testtexts: list[str] = []
+
+    # order books will be written in, as long as it is known.
+    order: list[str] | None = None
+    if bookids is not None and len(set(bookids)) == len(bookids):
+        order = proc_bookorder(sortorder, bookids, set(bookids))
+    elif sortorder == "none":
+        order = []
+    written = 0
+
+    with TemporaryFile() as bodyfile:
+        # store results
+        for count, (
+            bookid,
+            descriptiontext,
+            fname,
+            hasstrongs,
+            usfmtags,
+            errors,
+            testtext,
+        ) in enumerate(results):
+            if order is not None and (
+                bookid == "TEST"
+                or bookid in spool
+                or (bookids is not None and bookids[count : count + 1] != [bookid])
+            ):
+                order = None
+            if bookid != "TEST":
+                spool[bookid] = []
+                strongs.discard(bookid)
+                booklist.append(bookid)
+            elif bookid in spool:
+                descriptiontext = f"{descriptions[bookid]}\n{descriptiontext}"
+                testtexts.append(testtext)
+            else:
+                spool[bookid] = []
+                booklist.append(bookid)
+                testtexts.append(testtext)
+            descriptions[bookid] = descriptiontext
+            spool[bookid].append(fname)
+            if hasstrongs:
+                strongs.add(bookid)
+            usfmtagset.update(usfmtags)
+            bookerrors.append(errors)
+
+            # copy books that are next in the output.
+            if order is not None:
+                if bookids is None:
+                    order.append(bookid)
+                while written < len(order) and order[written] in spool:
+                    if written > 0:
+                        bodyfile.write(b"\n")
+                    proc_copyspool(bodyfile, spool[order[written]][0])
+                    written += 1
+
+        # ## Get order for books...
+        bookorder = proc_bookorder(sortorder, booklist, spool)
+
+        # write header, books in desired order, and footer
+        header = proc_osisheader(
             workid,
-            "\n".join(tmp2),
             langcode,
-            workid,
-            strongsheader,
-        ),
-        tmp,
-        OSISFOOTER,
+            [descriptions[_] for _ in bookorder],
+            bool(strongs.intersection(bookorder)),
+        )
+        header = proc_cleanup(header if nonormalize else proc_normalize(header))
+        usfmtagset.update(getre(USFMPATTERN).findall(header))
+        ofile.write(header.encode("utf_8"))
+        if order is not None and order[:written] == bookorder:
+            proc_copyfile(ofile, bodyfile)
+        else:
+            for i, bookid in enumerate(bookorder):
+                for j, fname in enumerate(spool[bookid]):
+                    if i > 0 or j > 0:
+                        ofile.write(b"\n")
+                    proc_copyspool(ofile, fname)
+        ofile.write(f"{OSISFOOTER}\n".encode("utf_8"))
+
+    # Print note about references not being processed.
+    LOG.warning("NOTE: References have not been processed.")
+
+    # report results of validating books
+    if validatebooks:
+        LOG.info("Validating osis xml...")
+        proc_xmlvalidatebooks(bookerrors, header)
+
+    # report unhandled usfm tags that are leftover after processing
+    if usfmtagset:
+        LOG.warning("Unhandled USFM Tags: %s", ", ".join(sorted(usfmtagset)))
+
+    # TEST books are printed as they were converted, like proc_writeosis does.
+    if testtexts:
+        print("\n".join(testtexts))
+
+
+def proc_writeosis(
+    books: dict[str, str],
+    descriptions: dict[str, str],
+    booklist: list[str],
+    sortorder: str,
+    langcode: str,
+    nonormalize: bool,
+    workid: str,
+    outfile: str,
+    dodebug: bool = False,
+    validatebooks: bool = False,
+    executor: Executor | None = None,
+) -> None:
+    """
+    Assemble, validate and write osis for books stored by proc_storeresults.
+
+    Unless nonormalize or dodebug is set, books other than TEST books must
+    already be normalized by proc_normalizebook. When validatebooks is set,
+    books are validated separately using executor, or in this process if
+    executor is None.
+
+    """
+    normalized = not nonormalize and not dodebug
+    validatebooks = validatebooks and HAVELXML
+    testbook = books.get("TEST")
+    if normalized and testbook is not None:
+        books["TEST"] = proc_normalize(testbook)
+
+    # ## Get order for books...
+    bookorder = proc_bookorder(sortorder, booklist, books)
+    tmp = "\n".join([books[_] for _ in bookorder])
+    header = proc_osisheader(
+        workid,
+        langcode,
+        [descriptions[_] for _ in bookorder],
+        "<w " in tmp,
     )
+    if normalized:
+        header = proc_normalize(header)
+
+    # validate books separately using the process pool if requested.
+    if validatebooks:
+        LOG.info("Validating osis xml...")
+        proc_xmlvalidatebooks(
+            (
+                executor.map(
+                    proc_xmlvalidatebook,
+                    bookorder,
+                    [books[_] for _ in bookorder],
+                    repeat(nonormalize),
+                )
+                if executor is not None
+                else (proc_xmlvalidatebook(_, books[_], nonormalize) for _ in bookorder)
+            ),
+            header if nonormalize else proc_normalize(header),
+        )
+
+    # assemble osis doc in desired order
+    osisdoc = "{}{}{}\n".format(header, tmp, OSISFOOTER)
 
     # Print note about references not being processed.
     LOG.warning("NOTE: References have not been processed.")
 
-    # apply NFC normalization to text unless explicitly disabled.
+    # apply NFC normalization to text unless explicitly disabled. only
+    # needed here in debug mode, since the books and header are already
+    # normalized otherwise.
     osisdoc2 = (
         encode(osisdoc, "utf_8")
-        if nonormalize
-        else encode(normalize("NFC", osisdoc), "utf_8")
+        if nonormalize or normalized
+        else encode(proc_normalize(osisdoc), "utf_8")
     )
 
     # validate and "pretty print" our osis doc if requested.
-    if HAVELXML:
-        osisdoc2 = proc_xmlvalidate(osisdoc2)
-    else:
+    if not HAVELXML:
         LOG.error("LXML needs to be installed for validation.")
+    elif not validatebooks:
+        osisdoc2 = proc_xmlvalidate(osisdoc2)
 
     # debug output... don't use formatted xml...
     if dodebug:
@@ -2989,32 +4447,191 @@ def processfiles(
 
     # find unhandled usfm tags that are leftover after processing
     usfmtagset: set[str] = set()
-    usfmtagset.update(USFMRE.findall(osisdoc2.decode("utf_8")))
+    usfmtagset.update(getre(USFMPATTERN).findall(osisdoc2.decode("utf_8")))
     if usfmtagset:
         LOG.warning("Unhandled USFM Tags: %s", ", ".join(sorted(usfmtagset)))
 
     # simple whitespace cleanups before writing to file...
-    with StringIO() as newdoc:
-        newdoc.write(
-            osisdoc2.decode("utf_8")
-            .replace(" <note", "<note")
-            .replace(" </p>", "</p>")
-            .replace(" </item>", "</item>")
-            .replace(" </l>", "</l>")
-            .replace("</w><w", "</w> <w")
-            .replace(" </w>", "</w>")
-            .replace("</w><transChange", "</w> <transChange")
-            .replace("</transChange><w", "</transChange> <w")
-        )
-        osisdoc2 = newdoc.getvalue().encode("utf_8")
+    osisdoc2 = proc_cleanup(osisdoc2.decode("utf_8")).encode("utf_8")
 
     # write doc to file
-    outfile = f"{workid}.osis" if outputfile is None else outputfile
     with open(outfile, "wb") as ofile:
         ofile.write(osisdoc2)
 
-    if "TEST" in books:
-        print(books["TEST"])
+    if testbook is not None:
+        print(testbook)
+
+
+def processfiles(
+    fnames: list[str],
+    fencoding: str,
+    dodebug: bool,
+    sortorder: str,
+    langcode: str,
+    nonormalize: bool,
+    workid: str,
+    outputfile: str,
+    stream: bool = False,
+    cachedir: str | None = None,
+    validatebooks: bool = False,
+    executor: Executor | None = None,
+    chunksize: int | None = None,
+    profile: str | None = None,
+    profileformat: str = "table",
+    workers: int | None = None,
+    startmethod: str | None = None,
+    serial: bool = False,
+) -> None:
+    """
+    Process usfm files specified on command line.
+
+    An executor that is given is left running when processing is done.
+    serial converts books in this process like debug mode, without the
+    debug output.
+
+    """
+    # get encoding of all files. The files are read by the processes that
+    # convert them.
+    LOG.info("Reading files... ")
+    processtexts(
+        [(_, proc_bookencoding(_, fencoding)) for _ in fnames],
+        dodebug,
+        sortorder,
+        langcode,
+        nonormalize,
+        workid,
+        outputfile,
+        stream=stream,
+        cachedir=cachedir,
+        validatebooks=validatebooks,
+        executor=executor,
+        chunksize=chunksize,
+        profile=profile,
+        profileformat=profileformat,
+        workers=workers,
+        startmethod=startmethod,
+        serial=serial,
+    )
+
+
+def processtexts(
+    booktexts: Iterable[str | tuple[str, str]],
+    dodebug: bool,
+    sortorder: str,
+    langcode: str,
+    nonormalize: bool,
+    workid: str,
+    outputfile: str,
+    stream: bool = False,
+    cachedir: str | None = None,
+    validatebooks: bool = False,
+    executor: Executor | None = None,
+    chunksize: int | None = None,
+    profile: str | None = None,
+    profileformat: str = "table",
+    workers: int | None = None,
+    startmethod: str | None = None,
+    serial: bool = False,
+) -> None:
+    """
+    Process the text of usfm books.
+
+    Each book is its text, or its file name and encoding. booktexts may be
+    a generator, which is read as books are needed.
+
+    """
+    # process file contents
+    results: Iterable[tuple[str, ...]]
+    bookprofiles: list[dict[str, Any]] | None = [] if profile is not None else None
+    outfile = f"{workid}.osis" if outputfile is None else outputfile
+    LOG.info("Processing files...")
+    validatebooks = validatebooks and HAVELXML
+    # books are converted serially in debug mode. a process pool isn't
+    # started for a single book that isn't split into chunks either, since
+    # starting the pool takes longer than the pool can save.
+    serial = (
+        serial
+        or dodebug
+        or (
+            executor is None
+            and isinstance(booktexts, list)
+            and len(booktexts) == 1
+            and chunksize is None
+        )
+    )
+    if executor is None and workers is None:
+        workers = proc_workercount()
+    with (
+        nullcontext(None if serial else executor)
+        if executor is not None or serial
+        else proc_executor(workers, startmethod)
+    ) as pool:
+        # when streaming, books are written to spool files by the processes
+        # that convert them and copied in order as they finish. knowing the
+        # ids of all books beforehand lets them be copied before all are done.
+        if stream:
+            bookids: list[str] | None = None
+            if isinstance(booktexts, list):
+                bookids = [proc_predictbookid(_) or "" for _ in booktexts]
+                if "" in bookids:
+                    bookids = None
+            with (
+                TemporaryDirectory(prefix="u2o-") as spooldir,
+                open(outfile, "wb") as ofile,
+            ):
+                proc_writestream(
+                    ofile,
+                    proc_convert(
+                        booktexts,
+                        pool,
+                        cachedir,
+                        chunksize,
+                        bookprofiles,
+                        partial(proc_spoolbook, spooldir, nonormalize, validatebooks),
+                        workers,
+                    ),
+                    sortorder,
+                    langcode,
+                    nonormalize,
+                    workid,
+                    validatebooks,
+                    bookids,
+                )
+            if profile is not None:
+                proc_profilereport(bookprofiles, profile, profileformat)
+            if not HAVELXML:
+                LOG.error("LXML needs to be installed for validation.")
+            elif not validatebooks:
+                proc_xmlvalidatefile(outfile)
+            return
+
+        # store results. books are normalized by the processes that convert
+        # them, except in debug mode where the output isn't normalized.
+        results = proc_convert(
+            booktexts,
+            pool,
+            cachedir,
+            chunksize,
+            bookprofiles,
+            proc_normalizebook if not nonormalize and not dodebug else None,
+            workers,
+        )
+        books, descriptions, booklist = proc_storeresults(results)
+        if profile is not None:
+            proc_profilereport(bookprofiles, profile, profileformat)
+        proc_writeosis(
+            books,
+            descriptions,
+            booklist,
+            sortorder,
+            langcode,
+            nonormalize,
+            workid,
+            outfile,
+            dodebug,
+            validatebooks,
+            pool,
+        )
 
 
 # -------------------------------------------------------------------------- #
@@ -3043,7 +4660,7 @@ if __name__ == "__main__":
         "-l", help="specify langauge code", metavar="LANG", default="und"
     )
     PARSER.add_argument(
-        "-s", help="sort order", choices=BOOKORDERS, default="canonical"
+        "-s", help="sort order", choices=proc_bookorders(), default="canonical"
     )
     PARSER.add_argument("-v", help="verbose output", action="store_true")
     PARSER.add_argument(
@@ -3054,6 +4671,22 @@ if __name__ == "__main__":
     PARSER.add_argument(
         "-n", help="disable unicode NFC normalization", action="store_true"
     )
+    PARSER.add_argument(
+        "--stream",
+        help="write books to output as they are converted (output is not reformatted)",
+        action="store_true",
+    )
+    PARSER.add_argument(
+        "--validate-books",
+        help="validate books separately in parallel (output is not reformatted)",
+        action="store_true",
+    )
+    PARSER.add_argument(
+        "--cache",
+        help="directory used to cache converted books between runs",
+        metavar="DIR",
+    )
+    proc_poolargs(PARSER)
     PARSER.add_argument(
         "file",
         help="file or files to process (wildcards allowed)",
@@ -3061,12 +4694,17 @@ if __name__ == "__main__":
         metavar="filename",
     )
     ARGS: argsNamespace = PARSER.parse_args()
+    proc_startup()
 
     if not HAVELXML:
         LOG.warning("Note:  lxml is not installed. Skipping OSIS validation.")
 
     ARGS.file = [_ for __ in ARGS.file for _ in chain(glob(__)) if isfile(_)]
 
+    if ARGS.workers is not None and ARGS.workers < 1:
+        LOG.error("*** number of workers must be at least 1. ***")
+        sysexit()
+
     if ARGS.v:
         LOG.setLevel(INFO)
     if ARGS.d:
@@ -3080,4 +4718,13 @@ if __name__ == "__main__":
         ARGS.n,
         ARGS.workid,
         ARGS.o,
+        stream=ARGS.stream,
+        cachedir=ARGS.cache,
+        validatebooks=ARGS.validate_books,
+        chunksize=ARGS.chunk_size,
+        profile=ARGS.profile_output if ARGS.profile else None,
+        profileformat=ARGS.profile_format,
+        workers=ARGS.workers,
+        startmethod=ARGS.start_method,
+        serial=ARGS.serial,
     )
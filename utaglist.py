@@ -6,20 +6,39 @@ List ufm tags.
 A simple script to generate a list of usfm tags that were used in one
 or more utf8 encoded usfm files. Requires python3.
 
+Each file is decoded and scanned once, and files are scanned in a pool of
+worker processes. Large files, such as a whole bible in a single file, are
+memory mapped and split into pieces that are scanned in parallel. Tag
+counts for each file and for all files together can be written as JSON or
+CSV.
+
 This script is public domain.
 
 """
 
-import os.path
+import csv
+import json
+import os
 import re
+import sys
 from argparse import ArgumentParser, Namespace as argsNamespace
+from codecs import decode
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 from itertools import chain
+from mmap import ACCESS_READ, mmap
+from typing import Iterator, TextIO
+
+# pylint: disable=too-many-arguments
 
 # -------------------------------------------------------------------------- #
 
-VERSION = "1.1.3"
+VERSION = "1.2.0"
+
+# files larger than twice this size are split into pieces of about this
+# size so they can be scanned in parallel.
+PIECESIZE = 16 * 1024 * 1024
 
 # -------------------------------------------------------------------------- #
 
@@ -412,42 +431,175 @@ USFMRE: re.Pattern[str] = re.compile(
 # -------------------------------------------------------------------------- #
 
 
-def processtags(fnames: list[str], tcounts: bool) -> None:
-    """Process usfm tags in all files."""
-    count = 0
-    counttags: Counter[str] = Counter()
-    knownset = set()
+def getpieces(fname: str) -> list[tuple[str, int, int]]:
+    """
+    Split a file into pieces to scan for usfm tags.
 
-    filenames = (_ for __ in fnames for _ in chain(glob(__)) if os.path.isfile(_))
-    for fname in filenames:
-        with open(fname, "rb") as infile:
-            intext = infile.read()
+    Pieces of large files end after a newline. Tags never span more than one
+    line, and a newline byte is never part of a multibyte utf8 character, so
+    each piece can be decoded and scanned on its own.
 
-            # build tag set
-            knownset.update(USFMRE.findall(intext.decode("utf_8")))
+    """
+    size = os.path.getsize(fname)
+    if size <= PIECESIZE * 2:
+        return [(fname, 0, size)]
+    pieces = []
+    with (
+        open(fname, "rb") as infile,
+        mmap(infile.fileno(), 0, access=ACCESS_READ) as mfile,
+    ):
+        start = 0
+        while start < size:
+            end = mfile.find(b"\n", start + PIECESIZE)
+            end = size if end == -1 else end + 1
+            pieces.append((fname, start, end))
+            start = end
+    return pieces
 
-            # build usage counts
-            for i in USFMRE.findall(intext.decode("utf_8")):
-                count += 1
-                counttags[i] += 1
 
-    # split tags into known and unknown sets
-    unknownset = knownset.difference(KNOWNTAGS)
-    knownset = knownset.intersection(KNOWNTAGS)
+def scanpiece(piece: tuple[str, int, int]) -> Counter[str]:
+    """Decode a piece of a file once and count the usfm tags in it."""
+    fname, start, end = piece
+    if start == end:
+        return Counter()
+    with (
+        open(fname, "rb") as infile,
+        mmap(infile.fileno(), 0, access=ACCESS_READ) as mfile,
+        memoryview(mfile) as data,
+    ):
+        return Counter(USFMRE.findall(decode(data[start:end], "utf_8")))
 
-    # output results.
-    print()
+
+def censustags(
+    filenames: list[str], workers: int | None, serial: bool
+) -> list[tuple[str, Counter[str]]]:
+    """
+    Count usfm tags used in each file.
+
+    Pieces of files are scanned in a pool of worker processes unless there
+    is only one piece to scan or serial is True.
+
+    """
+    filepieces = [getpieces(_) for _ in filenames]
+    pieces = list(chain.from_iterable(filepieces))
+    results: Iterator[Counter[str]]
+    if serial or len(pieces) < 2:
+        results = map(scanpiece, pieces)
+    else:
+        # hand out pieces in chunks so many small files are cheap to scan.
+        chunksize = max(1, len(pieces) // ((workers or os.cpu_count() or 1) * 4))
+        with ProcessPoolExecutor(workers) as executor:
+            results = iter(list(executor.map(scanpiece, pieces, chunksize=chunksize)))
+
+    # combine the counts of the pieces of each file.
+    counts = []
+    for fname, fpieces in zip(filenames, filepieces):
+        counttags: Counter[str] = Counter()
+        for _ in fpieces:
+            counttags.update(next(results))
+        counts.append((fname, counttags))
+    return counts
+
+
+def writetext(
+    outfile: TextIO, counttags: Counter[str], knownset: set[str], tcounts: bool
+) -> None:
+    """Write the tags used and optionally their usage counts as text."""
+    unknownset = set(counttags).difference(knownset)
+    print(file=outfile)
     if knownset:
-        print(f"Known USFM Tags: {', '.join(sorted(knownset))}\n")
+        print(f"Known USFM Tags: {', '.join(sorted(knownset))}\n", file=outfile)
     if unknownset:
-        print(f"Unknown USFM Tags: {', '.join(sorted(unknownset))}\n")
+        print(f"Unknown USFM Tags: {', '.join(sorted(unknownset))}\n", file=outfile)
 
     # print tag usage counts
     if tcounts:
-        print("\nTag usage count:\n")
+        print("\nTag usage count:\n", file=outfile)
         for i in sorted(counttags):
-            print(f"{counttags[i]: 8} - {i}")
-        print(f"\nTotal number of usfm tags found:   {count}\n")
+            print(f"{counttags[i]: 8} - {i}", file=outfile)
+        print(
+            f"\nTotal number of usfm tags found:   {counttags.total()}\n",
+            file=outfile,
+        )
+
+
+def writejson(
+    outfile: TextIO,
+    counts: list[tuple[str, Counter[str]]],
+    counttags: Counter[str],
+    knownset: set[str],
+) -> None:
+    """Write tag counts for each file and for all files as JSON."""
+    json.dump(
+        {
+            "version": VERSION,
+            "files": [
+                {
+                    "file": fname,
+                    "count": tags.total(),
+                    "tags": {_: tags[_] for _ in sorted(tags)},
+                }
+                for fname, tags in counts
+            ],
+            "total": {
+                "files": len(counts),
+                "count": counttags.total(),
+                "tags": {_: counttags[_] for _ in sorted(counttags)},
+            },
+            "known": sorted(knownset),
+            "unknown": sorted(set(counttags).difference(knownset)),
+        },
+        outfile,
+        ensure_ascii=False,
+        indent=2,
+    )
+    outfile.write("\n")
+
+
+def writecsv(
+    outfile: TextIO,
+    counts: list[tuple[str, Counter[str]]],
+    counttags: Counter[str],
+    knownset: set[str],
+) -> None:
+    """
+    Write tag counts for each file and for all files as CSV.
+
+    Counts for all files together have an empty file name.
+
+    """
+    writer = csv.writer(outfile, lineterminator="\n")
+    writer.writerow(("file", "tag", "count", "known"))
+    for fname, tags in chain(counts, (("", counttags),)):
+        writer.writerows((fname, _, tags[_], int(_ in knownset)) for _ in sorted(tags))
+
+
+def processtags(
+    fnames: list[str],
+    tcounts: bool,
+    *,
+    outformat: str = "text",
+    outfile: TextIO = sys.stdout,
+    workers: int | None = None,
+    serial: bool = False,
+) -> None:
+    """Process usfm tags in all files."""
+    filenames = [_ for __ in fnames for _ in chain(glob(__)) if os.path.isfile(_)]
+    counts = censustags(filenames, workers, serial)
+
+    # combine counts for all files and find which tags are known
+    counttags: Counter[str] = Counter()
+    for _ in counts:
+        counttags.update(_[1])
+    knownset = set(counttags).intersection(KNOWNTAGS)
+
+    # output results.
+    if outformat == "json":
+        writejson(outfile, counts, counttags, knownset)
+    elif outformat == "csv":
+        writecsv(outfile, counts, counttags, knownset)
+    else:
+        writetext(outfile, counttags, knownset, tcounts)
 
 
 # -------------------------------------------------------------------------- #
@@ -464,9 +616,46 @@ if __name__ == "__main__":
         """,
     )
     PARSER.add_argument("-c", help="include usage counts for tags", action="store_true")
+    PARSER.add_argument(
+        "-f",
+        help="output format, json and csv include counts for each file",
+        choices=("text", "json", "csv"),
+        default="text",
+    )
+    PARSER.add_argument("-o", help="write output to file", metavar="output_file")
+    PARSER.add_argument(
+        "--workers",
+        help="number of worker processes, one per available cpu when not given",
+        type=int,
+        metavar="N",
+    )
+    PARSER.add_argument(
+        "--serial",
+        help="scan files one at a time without using worker processes",
+        action="store_true",
+    )
     PARSER.add_argument(
         "file", help="name of file to process (wildcards allowed)", nargs="+"
     )
     ARGS: argsNamespace = PARSER.parse_args()
+    if ARGS.workers is not None and ARGS.workers < 1:
+        PARSER.error("number of workers must be at least 1")
 
-    processtags(ARGS.file, ARGS.c)
+    if ARGS.o is not None:
+        with open(ARGS.o, "w", encoding="utf-8", newline="") as OUTFILE:
+            processtags(
+                ARGS.file,
+                ARGS.c,
+                outformat=ARGS.f,
+                outfile=OUTFILE,
+                workers=ARGS.workers,
+                serial=ARGS.serial,
+            )
+    else:
+        processtags(
+            ARGS.file,
+            ARGS.c,
+            outformat=ARGS.f,
+            workers=ARGS.workers,
+            serial=ARGS.serial,
+        )